@@ -0,0 +1,162 @@
+"""
+Card animations, run from the window's on_update.
+
+Every sprite in flight is a row in a few numpy arrays: where it started,
+where it's going, when it sets off, how long it takes and how it eases. Each
+frame works out the positions of all of them in one go, so 52 cards moving
+cost about the same as one.
+"""
+import numpy as np
+
+# Seconds a card takes to slide into place after a move, and during the deal
+MOVE_TIME = 0.15
+DEAL_TIME = 0.3
+
+# Seconds between one card setting off and the next, when a batch goes out one after another
+DEAL_STAGGER = 0.025
+
+
+def linear(t):
+    return t
+
+
+def ease_out_cubic(t):
+    """ Fast start, gentle landing """
+    return 1 - (1 - t) ** 3
+
+
+def ease_in_out_cubic(t):
+    """ Gentle start and landing """
+    return np.where(t < 0.5, 4 * t ** 3, 1 - (2 - 2 * t) ** 3 / 2)
+
+
+def ease_out_back(t):
+    """ Overshoots a little and settles back """
+    return 1 + 2.70158 * (t - 1) ** 3 + 1.70158 * (t - 1) ** 2
+
+
+# Easing curves, by the number an animation is given. Each maps an array of
+# progress values from 0 to 1 onto how far along the way the card is.
+EASINGS = [linear, ease_out_cubic, ease_in_out_cubic, ease_out_back]
+LINEAR, EASE_OUT, EASE_IN_OUT, EASE_OUT_BACK = range(len(EASINGS))
+
+
+class Animator:
+    """ Slides sprites to where they're going, all of them at once every frame """
+
+    def __init__(self, capacity=64):
+        # Sprite of each row, and the row of each sprite
+        self.sprites = []
+        self.rows = {}
+
+        self.start = np.zeros((capacity, 2))
+        self.end = np.zeros((capacity, 2))
+        self.begin = np.zeros(capacity)
+        self.duration = np.ones(capacity)
+        self.easing = np.zeros(capacity, dtype=np.intp)
+
+        # Seconds since the animator was made, moved on by update()
+        self.now = 0.0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def _grow(self):
+        """ Double the room for rows """
+        for name in ("start", "end", "begin", "duration", "easing"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+
+    def move(self, sprite, target, duration=MOVE_TIME, delay=0.0, easing=EASE_OUT):
+        """
+        Slide a sprite from where it is now to `target` (x, y), setting off after
+        `delay` seconds. A sprite already moving is sent to the new target instead.
+        """
+        row = self.rows.get(sprite)
+        if row is None:
+            row = len(self.sprites)
+            if row == len(self.begin):
+                self._grow()
+            self.sprites.append(sprite)
+            self.rows[sprite] = row
+        self.start[row] = sprite.position
+        self.end[row] = target
+        self.begin[row] = self.now + delay
+        self.duration[row] = duration
+        self.easing[row] = easing
+
+    def move_all(self, sprites, targets, duration=DEAL_TIME, stagger=DEAL_STAGGER, delay=0.0, easing=EASE_OUT):
+        """ Send sprites to their targets one after another, `stagger` seconds apart """
+        for i, (sprite, target) in enumerate(zip(sprites, targets)):
+            self.move(sprite, target, duration, delay + i * stagger, easing)
+
+    def queue(self, sprites, targets, duration=DEAL_TIME, stagger=DEAL_STAGGER, easing=EASE_OUT):
+        """ Like move_all(), but only starting once everything already scheduled has landed """
+        self.move_all(sprites, targets, duration, stagger, self.time_left(), easing)
+
+    def time_left(self):
+        """ Seconds until every sprite has landed """
+        count = len(self.sprites)
+        if not count:
+            return 0.0
+        return max(0.0, float(np.max(self.begin[:count] + self.duration[:count])) - self.now)
+
+    def target(self, sprite):
+        """ Where a sprite will end up """
+        row = self.rows.get(sprite)
+        return sprite.position if row is None else tuple(self.end[row].tolist())
+
+    def update(self, delta_time):
+        """ Move time on and put every moving sprite where it should be now """
+        self.now += delta_time
+        count = len(self.sprites)
+        if not count:
+            return
+
+        # How far through its animation each sprite is, then eased
+        progress = np.clip((self.now - self.begin[:count]) / self.duration[:count], 0.0, 1.0)
+        eased = np.empty(count)
+        easing = self.easing[:count]
+        for number, curve in enumerate(EASINGS):
+            chosen = easing == number
+            if chosen.any():
+                eased[chosen] = curve(progress[chosen])
+
+        # Sprites that have landed go exactly on their target, not a rounding error off it
+        start = self.start[:count]
+        end = self.end[:count]
+        done = progress >= 1.0
+        positions = np.where(done[:, None], end, start + (end - start) * eased[:, None])
+        for sprite, (x, y) in zip(self.sprites, positions.tolist()):
+            sprite.position = x, y
+
+        if done.any():
+            self._remove(~done)
+
+    def finish(self, sprites):
+        """ Put these sprites straight where they're going and stop animating them """
+        keep = np.ones(len(self.sprites), dtype=bool)
+        for sprite in sprites:
+            row = self.rows.get(sprite)
+            if row is not None:
+                sprite.position = tuple(self.end[row].tolist())
+                keep[row] = False
+        if not keep.all():
+            self._remove(keep)
+
+    def finish_all(self):
+        self.finish(list(self.sprites))
+
+    def clear(self):
+        """ Stop every animation where it is """
+        self.sprites = []
+        self.rows = {}
+
+    def _remove(self, keep):
+        """ Drop the rows not in `keep`, packing the rest to the front """
+        count = int(keep.sum())
+        for name in ("start", "end", "begin", "duration", "easing"):
+            array = getattr(self, name)
+            array[:count] = array[:len(keep)][keep]
+        self.sprites = [sprite for sprite, kept in zip(self.sprites, keep) if kept]
+        self.rows = {sprite: row for row, sprite in enumerate(self.sprites)}
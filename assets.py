@@ -0,0 +1,67 @@
+"""
+Loads the card images and the flip sound on a worker thread, so the window can
+open and draw straight away instead of waiting on the disk.
+
+The worker only decodes files. Putting the textures into the GPU's atlas has
+to happen on the thread that owns the window, which is what finish() is for.
+"""
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+import arcade
+
+from textures import CARD_TEXTURES
+
+FLIP_SOUND_FILE = path.join(path.dirname(path.abspath(__file__)), "flipSound.mp3")
+
+
+class Assets:
+    """ Everything the game loads from disk, filled in by the worker """
+
+    def __init__(self):
+        self.flip_sound = None
+        self.future = None
+
+        # Seconds the worker took
+        self.load_time = 0.0
+
+    def start(self):
+        """ Start loading in the background, unless that was already done """
+        if self.future is not None:
+            return
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="assets")
+        self.future = executor.submit(self._load)
+        # The thread goes away once the one job is done
+        executor.shutdown(wait=False)
+
+    def _load(self):
+        start = time.perf_counter()
+        CARD_TEXTURES.load()
+        # The card animations need numpy, which takes a while to import: better here than on the window's thread
+        importlib.import_module("animation")
+        try:
+            # Decoded once here rather than on every click
+            self.flip_sound = arcade.load_sound(FLIP_SOUND_FILE)
+        except FileNotFoundError as error:
+            # No MP3 decoder (pyglet needs FFmpeg for it), so the game just plays silently
+            print(error)
+        self.load_time = time.perf_counter() - start
+
+    @property
+    def ready(self):
+        """ Has the worker finished? """
+        return self.future is not None and self.future.done()
+
+    def finish(self, atlas):
+        """
+        Once ready, pack the card textures into the atlas the sprites draw from.
+        Call from the window's thread. Raises whatever went wrong on the worker.
+        """
+        self.future.result()
+        CARD_TEXTURES.upload(atlas)
+
+
+# Shared by the game and anything else that wants the same files
+ASSETS = Assets()
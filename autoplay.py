@@ -0,0 +1,76 @@
+"""
+Moves the game can make for the player.
+
+Once every tableau card is face up the game can't be lost any more (when
+the variant lets the face up pile go round as often as needed), so
+auto-complete plays it out. Auto-play instead only sends cards to the
+foundations that are safe there (see rules.is_safe_to_foundation), the same
+dominance rule the solver uses to cut down its search.
+"""
+import rules
+from rules import BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE
+
+
+def can_auto_complete(state):
+    """ Is every tableau card face up, with something left to play? """
+    if any(state.face_down[i] for i in state.variant.tableaus) or state.is_won():
+        return False
+    # With only so many passes through the face down pile, cards still in it can be lost
+    return state.variant.recycle_limit is None or not (state.piles[BOTTOM_FACE_DOWN_PILE] or
+                                                      state.piles[BOTTOM_FACE_UP_PILE])
+
+
+def safe_moves(state):
+    """ The safe foundation moves to make one after another from `state`, which is left untouched """
+    state = state.copy()
+    moves = []
+    move = rules.safe_move(state)
+    while move:
+        rules.apply(state, move)
+        moves.append(move)
+        move = rules.safe_move(state)
+    return moves
+
+
+def _foundation_move(state):
+    """ A move putting the lowest card that can go up onto the foundations, or None """
+    best = None
+    for src in (BOTTOM_FACE_UP_PILE, *state.variant.tableaus):
+        pile = state.piles[src]
+        if not pile or (best and pile[-1] >= best[0]):
+            continue
+        for dst in state.variant.foundations:
+            if rules.can_drop(state, pile[-1], dst):
+                best = pile[-1], rules.Move(src, dst, 1)
+                break
+    return best and best[1]
+
+
+def auto_complete_moves(state):
+    """
+    Moves that win from `state`, once can_auto_complete() says so. Cards go up
+    lowest first, turning over the face down pile whenever nothing can. Returns
+    None in the rare case that gets stuck: cards in the wrong order in the face
+    down pile need tableau moves to get past, which is a search. The game hands
+    that to the hint engine's background thread, see hint.HintEngine.winning_line().
+    """
+    state = state.copy()
+    moves = []
+
+    # Draws and recycles in a row without getting a card up: a full pass of the
+    # face down pile and back means going round again won't help
+    idle = 0
+    while not state.is_won():
+        move = _foundation_move(state)
+        if move:
+            idle = 0
+        else:
+            move = rules.draw_move(state) or rules.recycle_move(state)
+            idle += 1
+            cycle = len(state.piles[BOTTOM_FACE_DOWN_PILE]) + len(state.piles[BOTTOM_FACE_UP_PILE])
+            if move is None or idle > cycle:
+                break
+        rules.apply(state, move)
+        moves.append(move)
+
+    return moves if state.is_won() else None
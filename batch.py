@@ -0,0 +1,400 @@
+"""
+Batch engine: thousands of games stored as NumPy arrays, all moving one step
+at a time together.
+
+A batch of B games is a few arrays instead of B GameStates: the cards of every
+pile (B x piles x longest pile), the pile lengths and the face down counts.
+Each step works out a legal move mask over a fixed numbering of every move a
+game can make, picks one move per game and makes all of them at once, so a
+playout costs a few dozen array operations per step for the whole batch
+rather than Python code per game. It plays by the same rules as rules.py,
+random and greedy playouts being the throughput path for strategy tuning:
+
+    python batch.py --games 100000 --strategy greedy
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import deals
+import rules
+from rules import (ACE, BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE, CARD_VALUES, DECK_SIZE, DEFAULT_VARIANT, KING,
+                   PLAY_PILE_1, RED_BIT, SUIT_BITS)
+
+# Random and greedy playouts give up after this many moves, as in simulate.py
+MAX_MOVES = 1000
+
+# Games played together, enough to make each step's array operations worth it
+DEFAULT_BATCH_SIZE = 10_000
+
+# Kinds of move, each a block of the action numbering
+DRAW, RECYCLE, WASTE_TO_TABLEAU, WASTE_TO_FOUNDATION, TABLEAU_TO_FOUNDATION, TABLEAU_TO_TABLEAU, \
+    FOUNDATION_TO_TABLEAU = range(7)
+
+# Greedy move preferences, lowest first, much like the solver's move ordering.
+# Moves the greedy player never makes get NEVER.
+FOUNDATION_FIRST, REVEAL, FROM_WASTE, EMPTY_COLUMN, STOCK, NEVER = range(6)
+
+
+class Actions:
+    """
+    Every move a game of a variant can make, numbered: drawing, recycling, the
+    face up pile onto each tableau and foundation, each tableau onto each
+    foundation, each tableau onto each other tableau and each foundation onto
+    each tableau. A run moving between two tableaus can only ever be one
+    length, the one that fits the card it goes on, so (src, dst) is enough.
+    """
+
+    def __init__(self, variant=DEFAULT_VARIANT):
+        tableaus = list(variant.tableaus)
+        foundations = list(variant.foundations)
+        blocks = [
+            (DRAW, [(BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE)]),
+            (RECYCLE, [(BOTTOM_FACE_UP_PILE, BOTTOM_FACE_DOWN_PILE)]),
+            (WASTE_TO_TABLEAU, [(BOTTOM_FACE_UP_PILE, dst) for dst in tableaus]),
+            (WASTE_TO_FOUNDATION, [(BOTTOM_FACE_UP_PILE, dst) for dst in foundations]),
+            (TABLEAU_TO_FOUNDATION, [(src, dst) for src in tableaus for dst in foundations]),
+            (TABLEAU_TO_TABLEAU, [(src, dst) for src in tableaus for dst in tableaus]),
+            (FOUNDATION_TO_TABLEAU, [(src, dst) for src in foundations for dst in tableaus]),
+        ]
+        pairs = [pair for _, block in blocks for pair in block]
+        self.src = np.array([src for src, _ in pairs], dtype=np.intp)
+        self.dst = np.array([dst for _, dst in pairs], dtype=np.intp)
+        self.kind = np.array([kind for kind, block in blocks for _ in block], dtype=np.intp)
+
+        # Action number of every (src, dst) pair
+        self.numbers = {pair: number for number, pair in enumerate(pairs)}
+
+    def __len__(self):
+        return len(self.src)
+
+    def number(self, move):
+        """ Action number of a rules.Move """
+        return self.numbers[move.src, move.dst]
+
+
+class BatchGames:
+    """ B games of one variant as arrays, see the module docstring """
+
+    def __init__(self, cards, lengths, face_down, variant=DEFAULT_VARIANT):
+        self.variant = variant
+        self.actions = Actions(variant)
+
+        # Card ints of every pile, bottom first; past a pile's length is junk
+        self.cards = cards
+        self.lengths = lengths
+        self.face_down = face_down
+        self.recycles = np.zeros(len(cards), dtype=np.int16)
+
+        self.rows = np.arange(len(cards))
+        self.piles = np.arange(variant.pile_count)
+        self.tableaus = np.array(variant.tableaus, dtype=np.intp)
+        self.foundations = np.array(variant.foundations, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.cards)
+
+    @classmethod
+    def from_decks(cls, decks, variant=DEFAULT_VARIANT):
+        """ Deal games from a (B, deck size) array of decks, the same way rules.new_game() does """
+        count = len(decks)
+        cards = np.zeros((count, variant.pile_count, variant.deck_size), dtype=np.uint8)
+        lengths = np.zeros((count, variant.pile_count), dtype=np.int16)
+        face_down = np.zeros((count, variant.pile_count), dtype=np.int16)
+        decks = np.asarray(decks) % DECK_SIZE
+
+        # Which spots of the deck each tableau is dealt from is the same for every game
+        stock = list(range(variant.deck_size))
+        for pile_no in variant.tableaus:
+            dealt = [stock.pop() for _ in range(pile_no - PLAY_PILE_1 + 1)]
+            cards[:, pile_no, :len(dealt)] = decks[:, dealt]
+            lengths[:, pile_no] = len(dealt)
+            face_down[:, pile_no] = len(dealt) - 1
+        cards[:, BOTTOM_FACE_DOWN_PILE, :len(stock)] = decks[:, stock]
+        lengths[:, BOTTOM_FACE_DOWN_PILE] = len(stock)
+        return cls(cards, lengths, face_down, variant)
+
+    @classmethod
+    def from_seeds(cls, seeds, variant=DEFAULT_VARIANT):
+        """ The deals of these seeds, the same games simulate.py plays """
+        return cls.from_decks(np.array([deals.deal(seed, variant.deck_size) for seed in seeds]), variant)
+
+    @classmethod
+    def from_states(cls, states):
+        """ Games in the positions of some GameStates, all of one variant """
+        variant = states[0].variant
+        batch = cls.from_decks(np.zeros((len(states), variant.deck_size), dtype=np.uint8), variant)
+        for i, state in enumerate(states):
+            for pile_no, pile in enumerate(state.piles):
+                batch.cards[i, pile_no, :len(pile)] = pile
+                batch.lengths[i, pile_no] = len(pile)
+            batch.face_down[i] = state.face_down
+            batch.recycles[i] = state.recycles
+        return batch
+
+    def take(self, rows):
+        """ New batch of a copy of some of these games """
+        games = BatchGames(self.cards[rows], self.lengths[rows], self.face_down[rows], self.variant)
+        games.recycles = self.recycles[rows]
+        return games
+
+    def put(self, rows, games):
+        """ Copy games made by take(rows) back in """
+        self.cards[rows] = games.cards
+        self.lengths[rows] = games.lengths
+        self.face_down[rows] = games.face_down
+        self.recycles[rows] = games.recycles
+
+    def state(self, i):
+        """ Game `i` as a GameState """
+        state = rules.GameState(self.variant)
+        for pile_no, pile in enumerate(state.piles):
+            pile.frombytes(self.cards[i, pile_no, :self.lengths[i, pile_no]].tobytes())
+        state.face_down = self.face_down[i].tolist()
+        state.recycles = int(self.recycles[i])
+        return state
+
+    def won(self):
+        """ Which games have every card on the foundations """
+        return (self.lengths[:, self.foundations] == len(CARD_VALUES)).all(axis=1)
+
+    def _tops(self):
+        """ Top card of every pile, and which piles are empty """
+        empty = self.lengths == 0
+        tops = self.cards[self.rows[:, None], self.piles[None, :], np.maximum(self.lengths - 1, 0)]
+        return tops.astype(np.int16), empty
+
+    def legal(self):
+        """
+        Legal moves of every game, as a (B, actions) mask, with the number of cards
+        each move takes and a (B, actions) array of greedy preferences (see
+        greedy_playouts()). Games already won have no legal moves.
+        """
+        variant = self.variant
+        tops, empty = self._tops()
+        rank = tops >> SUIT_BITS
+        colour = tops & RED_BIT
+        lengths = self.lengths
+
+        tableau_top, tableau_rank, tableau_colour = (tops[:, self.tableaus], rank[:, self.tableaus],
+                                                     colour[:, self.tableaus])
+        tableau_empty = empty[:, self.tableaus]
+        foundation_top, foundation_empty = tops[:, self.foundations], empty[:, self.foundations]
+        waste, waste_empty = tops[:, BOTTOM_FACE_UP_PILE], empty[:, BOTTOM_FACE_UP_PILE]
+
+        def onto_foundations(card, card_empty):
+            """ (B, cards, foundations) mask of which card can go on which foundation """
+            card = card[:, :, None]
+            fits = np.where(foundation_empty[:, None, :], card >> SUIT_BITS == ACE,
+                            card == foundation_top[:, None, :] + (1 << SUIT_BITS))
+            return fits & ~card_empty[:, :, None]
+
+        def onto_tableaus(card, card_empty):
+            """ (B, cards, tableaus) mask of which single card can go on which tableau """
+            card = card[:, :, None]
+            fits = np.where(tableau_empty[:, None, :], card >> SUIT_BITS == KING,
+                            (card >> SUIT_BITS) + 1 == tableau_rank[:, None, :])
+            fits &= tableau_empty[:, None, :] | ((card & RED_BIT) != tableau_colour[:, None, :])
+            return fits & ~card_empty[:, :, None]
+
+        # Drawing and recycling
+        draw = ~empty[:, BOTTOM_FACE_DOWN_PILE]
+        recycle = empty[:, BOTTOM_FACE_DOWN_PILE] & ~waste_empty
+        if variant.recycle_limit is not None:
+            recycle &= self.recycles < variant.recycle_limit
+
+        waste_to_tableau = onto_tableaus(waste[:, None], waste_empty[:, None])[:, 0]
+        waste_to_foundation = onto_foundations(waste[:, None], waste_empty[:, None])[:, 0]
+        tableau_to_foundation = onto_foundations(tableau_top, tableau_empty)
+        foundation_to_tableau = onto_tableaus(foundation_top, foundation_empty)
+
+        # A face up run goes down a rank a card and alternates colours, so the card
+        # a tableau needs is `skip` cards up from the bottom of the run, if it's there
+        face_down = self.face_down[:, self.tableaus]
+        face_up = lengths[:, self.tableaus] - face_down
+        run_bottom = self.cards[self.rows[:, None], self.tableaus[None, :], face_down].astype(np.int16)
+        needed_rank = np.where(tableau_empty, KING, tableau_rank - 1)
+        skip = (run_bottom >> SUIT_BITS)[:, :, None] - needed_rank[:, None, :]
+        skip_colour = (run_bottom & RED_BIT)[:, :, None] ^ (skip & 1)
+        tableau_to_tableau = (skip >= 0) & (skip < face_up[:, :, None])
+        tableau_to_tableau &= tableau_empty[:, None, :] | (skip_colour != tableau_colour[:, None, :])
+        tableau_to_tableau &= ~np.eye(variant.columns, dtype=bool)[None]
+        run_count = face_up[:, :, None] - skip
+
+        count = len(self)
+        mask = np.concatenate([
+            draw[:, None], recycle[:, None], waste_to_tableau, waste_to_foundation,
+            tableau_to_foundation.reshape(count, -1), tableau_to_tableau.reshape(count, -1),
+            foundation_to_tableau.reshape(count, -1),
+        ], axis=1)
+        mask &= ~self.won()[:, None]
+
+        counts = np.ones(mask.shape, dtype=np.int16)
+        counts[:, 0] = np.minimum(variant.draw_count, lengths[:, BOTTOM_FACE_DOWN_PILE])
+        counts[:, 1] = lengths[:, BOTTOM_FACE_UP_PILE]
+        block = self.actions.kind == TABLEAU_TO_TABLEAU
+        counts[:, block] = np.where(tableau_to_tableau, run_count, 1).reshape(count, -1)
+
+        # Greedy preferences: the whole run off face down cards is a reveal, the whole
+        # run off the last card of a column empties it; splitting runs, moving a bare
+        # column to another empty one and taking cards off the foundations never happen
+        whole_run = skip == 0
+        run_move = np.where(whole_run & (face_down > 0)[:, :, None], REVEAL,
+                            np.where(whole_run & ~tableau_empty[:, None, :], EMPTY_COLUMN, NEVER))
+        preference = np.concatenate([
+            np.full((count, 2), STOCK), np.full(waste_to_tableau.shape, FROM_WASTE),
+            np.full(waste_to_foundation.shape, FOUNDATION_FIRST),
+            np.full((count, tableau_to_foundation[0].size), FOUNDATION_FIRST), run_move.reshape(count, -1),
+            np.full((count, foundation_to_tableau[0].size), NEVER),
+        ], axis=1)
+        preference[~mask] = NEVER
+        return mask, counts, preference
+
+    def move(self, i, action, counts):
+        """ rules.Move for action `action` of game `i`, from the counts legal() gave """
+        return rules.Move(int(self.actions.src[action]), int(self.actions.dst[action]), int(counts[i, action]))
+
+    def apply(self, actions, counts, active):
+        """
+        Make one move in every `active` game: action actions[i] taking counts[i]
+        cards, as rules.apply() would. The moves have to be legal.
+        """
+        rows = self.rows[active]
+        if not len(rows):
+            return
+        actions = actions[active]
+        count = counts[active].astype(np.intp)
+        src = self.actions.src[actions]
+        dst = self.actions.dst[actions]
+        kind = self.actions.kind[actions]
+        src_length = self.lengths[rows, src].astype(np.intp)
+        dst_length = self.lengths[rows, dst].astype(np.intp)
+
+        # Card `k` of each move, for every k any move needs, flattened down to the
+        # cards actually moving. The bottom piles flip them over on the way.
+        k = np.arange(count.max())[None, :]
+        moving = k < count[:, None]
+        game = np.broadcast_to(np.arange(len(rows))[:, None], moving.shape)[moving]
+        k = np.broadcast_to(k, moving.shape)[moving]
+        reverse = (kind[game] == DRAW) | (kind[game] == RECYCLE)
+        from_spot = np.where(reverse, src_length[game] - 1 - k, src_length[game] - count[game] + k)
+        self.cards[rows[game], dst[game], dst_length[game] + k] = self.cards[rows[game], src[game], from_spot]
+
+        self.lengths[rows, src] -= count.astype(np.int16)
+        self.lengths[rows, dst] += count.astype(np.int16)
+        if self.variant.recycle_limit is not None:
+            self.recycles[rows] += (kind == RECYCLE)
+
+        # Discover the top card of the tableau we just left
+        left = self.lengths[rows, src]
+        flip = (left > 0) & (self.face_down[rows, src] == left) & (src >= PLAY_PILE_1) \
+            & (src <= self.variant.last_tableau)
+        self.face_down[rows[flip], src[flip]] -= 1
+
+
+def _play(games, choose, max_moves, deadline=None):
+    """
+    Make moves in every game until choose() has none for it. choose(games, live)
+    picks (actions, card counts, which games move) for the games still playing,
+    `live` being their rows in `games`. Games that stop are dropped from the
+    arrays worked on, so the long games at the end don't drag the whole batch
+    along. Stops early at `deadline`, a time.perf_counter() time, if given.
+    Returns the number of moves each game made.
+    """
+    moves = np.zeros(len(games), dtype=np.int32)
+    live = np.arange(len(games))
+    playing = games
+    for _ in range(max_moves):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        actions, counts, active = choose(playing, live)
+        if not active.any():
+            break
+        playing.apply(actions, counts, active)
+        moves[live] += active
+
+        # A game that can't move now never will, its position stays the same
+        if active.sum() < len(live) // 2:
+            games.put(live, playing)
+            live = live[active]
+            playing = games.take(live)
+    games.put(live, playing)
+    return moves
+
+
+def random_playouts(games, rng, max_moves=MAX_MOVES, deadline=None):
+    """ Play every game with uniformly random legal moves. Returns the number of moves each made. """
+    def choose(playing, live):
+        mask, counts, _ = playing.legal()
+        # A random score for every legal move, the highest one gets played
+        actions = np.argmax(np.where(mask, rng.random(mask.shape), -1.0), axis=1)
+        return actions, counts[playing.rows, actions], mask.any(axis=1)
+
+    return _play(games, choose, max_moves, deadline)
+
+
+def greedy_playouts(games, max_moves=MAX_MOVES, rng=None, deadline=None):
+    """
+    Play every game greedily: cards to the foundations first, then moves that turn
+    a face down card over, then cards off the face up pile, then moves that empty a
+    column, and only then the face down pile. A game stops once it has been all the
+    way round the face down pile without anything else to do. Returns the number of
+    moves each made.
+
+    Among equally good moves the first is played, or a random one when `rng` is given.
+    """
+    # Draws and recycles in a row, by game
+    idle = np.zeros(len(games), dtype=np.int32)
+
+    def choose(playing, live):
+        _, counts, preference = playing.legal()
+        # First of the most preferred moves, or any of them: noise under 1 only reorders ties
+        actions = np.argmin(preference if rng is None else preference + rng.random(preference.shape), axis=1)
+        best = preference[playing.rows, actions]
+        idle[live] = np.where(best == STOCK, idle[live] + 1, 0)
+        cycle = playing.lengths[:, BOTTOM_FACE_DOWN_PILE] + playing.lengths[:, BOTTOM_FACE_UP_PILE]
+        active = (best != NEVER) & (idle[live] <= cycle)
+        return actions, counts[playing.rows, actions], active
+
+    return _play(games, choose, max_moves, deadline)
+
+
+PLAYOUTS = {
+    "random": lambda games, rng: random_playouts(games, rng),
+    "greedy": lambda games, rng: greedy_playouts(games),
+}
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Play lots of seeded deals at once as NumPy arrays.")
+    parser.add_argument("--games", type=int, default=100_000, help="how many deals to play")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first deal")
+    parser.add_argument("--strategy", choices=sorted(PLAYOUTS), default="greedy")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="games played together")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    rng = np.random.default_rng(args.first_seed)
+    start = time.perf_counter()
+    played = won = 0
+    for first in range(args.first_seed, args.first_seed + args.games, args.batch_size):
+        seeds = range(first, min(first + args.batch_size, args.first_seed + args.games))
+        games = BatchGames.from_seeds(seeds, variant)
+        PLAYOUTS[args.strategy](games, rng)
+        played += len(games)
+        won += int(games.won().sum())
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.strategy}: won {won} of {played} ({won / max(played, 1):.2%}) "
+          f"in {elapsed:.1f}s ({played / elapsed:.0f} games/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Benchmarks for the hot paths: dealing, the headless rules, the solver and
+drawing a frame.
+
+Every number goes to a JSON file, and is compared against a baseline saved
+earlier on the same machine, so a change that slows one of them down shows up:
+
+    python benchmark.py --save-baseline
+    ... change things ...
+    python benchmark.py
+
+Exits with status 1 when anything got slower than the baseline by more than
+--tolerance, when a benchmark fails, or when a number in the baseline is
+missing from the run. A machine that can't run some of them (no display or
+GPU for render and startup) names them with --skip.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import deals
+import rules
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+# How much worse than the baseline a number can get before it counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# Fixed seeds, so every run measures the same work
+DEAL_COUNT = 2000
+RULES_SEEDS = range(20)
+RULES_PLAYOUT_MOVES = 60
+SOLVER_SEEDS = range(20)
+SOLVER_MAX_NODES = 50_000
+RENDER_SEED = 1
+RENDER_FRAMES = 100
+
+# Times each measurement is repeated, the best one counting: the others are
+# what the rest of the machine was doing
+REPEATS = 3
+
+
+def _best_time(function, repeats=REPEATS):
+    """ Fastest of a few runs of function(), in seconds """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_deals():
+    """ Deals shuffled per second, one at a time and in a NumPy batch """
+    one_at_a_time = _best_time(lambda: [deals.deal(seed) for seed in range(DEAL_COUNT)])
+    batched = _best_time(lambda: deals.deal_batch(DEAL_COUNT, 0))
+    return {
+        "deal_per_s": DEAL_COUNT / one_at_a_time,
+        "deal_batch_per_s": DEAL_COUNT / batched,
+    }
+
+
+def _rules_positions():
+    """ Positions a little way into some random games, the kind the rules spend their time on """
+    positions = []
+    for seed in RULES_SEEDS:
+        rng = random.Random(seed)
+        state = rules.new_game(deals.deal(seed))
+        for _ in range(RULES_PLAYOUT_MOVES):
+            positions.append(state.copy())
+            moves = rules.legal_moves(state)
+            if not moves:
+                break
+            rules.apply(state, rng.choice(moves))
+    return positions
+
+
+def bench_rules():
+    """ legal_moves() calls and apply()/undo() pairs per second """
+    positions = _rules_positions()
+    moves = [rules.legal_moves(state) for state in positions]
+    move_count = sum(len(legal) for legal in moves)
+
+    def apply_and_undo():
+        for state, legal in zip(positions, moves):
+            for move in legal:
+                rules.undo(state, move, rules.apply(state, move))
+
+    legal_moves_time = _best_time(lambda: [rules.legal_moves(state) for state in positions])
+    apply_time = _best_time(apply_and_undo)
+    return {
+        "legal_moves_per_s": len(positions) / legal_moves_time,
+        "apply_undo_per_s": move_count / apply_time,
+    }
+
+
+def bench_solver():
+    """ Time to solve each deal of a fixed corpus, with a fresh solver every time """
+    import solver
+
+    times = []
+    nodes = won = 0
+    for seed in SOLVER_SEEDS:
+        state = rules.new_game(deals.deal(seed))
+        start = time.perf_counter()
+        result = solver.solve(state, max_nodes=SOLVER_MAX_NODES)
+        times.append(time.perf_counter() - start)
+        nodes += result.nodes
+        won += bool(result.won)
+    return {
+        "solve_median_ms": statistics.median(times) * 1000,
+        "solve_total_s": sum(times),
+        "solver_nodes_per_s": nodes / sum(times),
+        # Not a speed: a change here means the search itself changed
+        "solver_won": won,
+    }
+
+
+def bench_render():
+    """ Milliseconds to draw a frame of a freshly dealt game, in a headless window """
+    os.environ.setdefault("ARCADE_HEADLESS", "1")
+    import solitaire
+
+    window = solitaire.SolitaireGame()
+    try:
+        window.setup(RENDER_SEED)
+        # The textures load on a worker, on_update() deals once they are in
+        while window.state is None:
+            window.on_update(0.0)
+            time.sleep(0.001)
+        window.animator.finish_all()
+
+        def draw_frames():
+            for _ in range(RENDER_FRAMES):
+                window.on_draw()
+            # Wait for the GPU too, not only for the draw calls to be queued
+            window.ctx.finish()
+
+        frame_time = _best_time(draw_frames) / RENDER_FRAMES
+    finally:
+        window.close()
+    return {"on_draw_ms": frame_time * 1000}
+
+
+def bench_startup():
+    """ Launch to first interactive frame, see startup.py """
+    # The game runs in a child process, which gets the same environment
+    os.environ.setdefault("ARCADE_HEADLESS", "1")
+    import startup
+
+    times = [startup.launch()["interactive"] for _ in range(REPEATS)]
+    return {"startup_interactive_ms": min(times) * 1000}
+
+
+BENCHMARKS = {
+    "deals": bench_deals,
+    "rules": bench_rules,
+    "solver": bench_solver,
+    "render": bench_render,
+    "startup": bench_startup,
+}
+
+# Counts that should stay exactly the same, not get faster or slower
+EXACT_METRICS = {"solver_won"}
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results against a baseline, both {benchmark: {metric: value}}, for
+    the benchmarks that were run. Returns a list of (benchmark, metric, baseline
+    value, value, change, regressed), change being the fraction better (positive)
+    or worse (negative). A metric in the baseline the run didn't produce has a
+    value of None and counts as regressed.
+    """
+    rows = []
+    for name, metrics in results.items():
+        for metric, old in baseline.get(name, {}).items():
+            if metric not in metrics:
+                rows.append((name, metric, old, None, 0.0, True))
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if old is None:
+                continue
+            if metric in EXACT_METRICS:
+                rows.append((name, metric, old, value, 0.0, value != old))
+                continue
+            if not old:
+                continue
+            change = (value - old) / old if higher_is_better(metric) else (old - value) / old
+            rows.append((name, metric, old, value, change, change < -tolerance))
+    return rows
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Benchmark solitaire's hot paths against a saved baseline.")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"benchmarks to run, of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--out", default=RESULTS_FILE, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file of results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file too")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fraction worse than the baseline that counts as a regression")
+    parser.add_argument("--skip", action="append", default=[], metavar="BENCHMARK",
+                        help="benchmark not to run, e.g. render on a machine without a GPU (can be repeated)")
+    args = parser.parse_args(argv)
+    unknown = (set(args.benchmarks) | set(args.skip)) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"no benchmark called {', '.join(sorted(unknown))}")
+
+    results = {}
+    failed = []
+    for name in args.benchmarks or BENCHMARKS:
+        if name in args.skip:
+            continue
+        start = time.perf_counter()
+        try:
+            results[name] = BENCHMARKS[name]()
+        except Exception as error:
+            # Reported, and it fails the run below: a broken benchmark is no pass
+            print(f"{name}: FAILED, {type(error).__name__}: {error}", file=sys.stderr)
+            failed.append(name)
+            results[name] = {}
+            continue
+        print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    with open(args.out, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {args.out}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    if args.save_baseline:
+        if failed:
+            print(f"Not saving a baseline with failed benchmarks: {', '.join(failed)}")
+            sys.exit(1)
+        # Only the benchmarks that were run are replaced, the rest of the baseline stays
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not baseline:
+        for name, metrics in results.items():
+            for metric, value in metrics.items():
+                print(f"{name:8} {metric:24} {value:12.2f}")
+        print(f"No baseline at {args.baseline}, save one with --save-baseline")
+        if failed:
+            sys.exit(1)
+        return
+
+    rows = compare(results, baseline, args.tolerance)
+    for name, metric, old, value, change, regressed in rows:
+        if value is None:
+            print(f"{name:8} {metric:24} {old:12.2f} ->      missing  REGRESSION")
+        else:
+            print(f"{name:8} {metric:24} {old:12.2f} -> {value:12.2f}  {change:+7.1%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    regressions = sum(row[-1] for row in rows)
+    if regressions or failed:
+        print(f"{regressions} regression(s) past {args.tolerance:.0%}, {len(failed)} failed benchmark(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
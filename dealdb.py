@@ -0,0 +1,146 @@
+"""
+Database of deals known to be winnable, built offline by the solver.
+
+The file is a short header, saying which rules variant the deals were solved
+for, and then fixed size records of (seed, solution length), sorted by seed: first every winnable deal, then every deal the solver
+didn't win, marked NOT_WINNABLE if it searched every line or UNKNOWN if it
+gave up first. The game reads it through mmap, so picking a winnable deal or
+looking one up never loads the whole file into memory.
+
+Build one with:
+
+    python dealdb.py --count 100000 --out deals.db
+    python dealdb.py --count 10000 --variant draw-one --out draw-one.db
+
+The solver's depth-first search finds a winning line but not necessarily the
+shortest, so the stored length is the length of the line it found.
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+import rules
+
+MAGIC = b"SOLDB\x02"
+
+# Number of winnable records, then number of others, then the variant's draw
+# count, recycle limit (one up, 0 for no limit), decks and columns
+HEADER = struct.Struct("<6sIIBBBB")
+
+# Seed and solution length
+RECORD = struct.Struct("<QH")
+
+# Solution lengths stored for deals the solver found no win in, and for deals
+# it ran out of nodes on before it could tell
+NOT_WINNABLE = 0xFFFF
+UNKNOWN = 0xFFFE
+
+
+def write_database(path, results, variant=rules.DEFAULT_VARIANT):
+    """
+    Write (seed, won, solution length) for deals of a variant to a database file,
+    `won` being the solver's: True, False, or None when it gave up.
+    """
+    winnable = sorted((seed, length) for seed, won, length in results if won)
+    others = sorted((seed, UNKNOWN if won is None else NOT_WINNABLE) for seed, won, _ in results if not won)
+    recycle_limit = 0 if variant.recycle_limit is None else variant.recycle_limit + 1
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(winnable), len(others), variant.draw_count, recycle_limit,
+                               variant.decks, variant.columns))
+        for seed, length in winnable:
+            file.write(RECORD.pack(seed, min(length, UNKNOWN - 1)))
+        for seed, marker in others:
+            file.write(RECORD.pack(seed, marker))
+
+
+class DealDatabase:
+    """ Read-only, memory mapped view of a deal database """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size or self.data[:len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not a deal database")
+        (_, self.winnable_count, self.other_count,
+         draw_count, recycle_limit, decks, columns) = HEADER.unpack_from(self.data)
+        self.variant = rules.Variant(draw_count, recycle_limit - 1 if recycle_limit else None, decks, columns)
+
+    def __len__(self):
+        return self.winnable_count + self.other_count
+
+    def close(self):
+        self.data.close()
+
+    def _record(self, index):
+        return RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+
+    def _search(self, seed, first, count):
+        """ Binary search one sorted section for a seed, returns its record or None """
+        low, high = first, first + count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            if record[0] < seed:
+                low = middle + 1
+            elif record[0] > seed:
+                high = middle
+            else:
+                return record
+        return None
+
+    def lookup(self, seed):
+        """
+        Solution length of a winnable deal, NOT_WINNABLE for one the solver found no
+        win in, UNKNOWN for one it gave up on, or None if the seed isn't in the database.
+        """
+        record = (self._search(seed, 0, self.winnable_count)
+                  or self._search(seed, self.winnable_count, self.other_count))
+        return record[1] if record else None
+
+    def random_winnable(self, rng=random):
+        """ (seed, solution length) of a winnable deal picked at random """
+        if not self.winnable_count:
+            raise LookupError("No winnable deals in the database")
+        return self._record(rng.randrange(self.winnable_count))
+
+
+def main(argv=None):
+    """ Command line entry point: solve a range of seeds and write the database """
+    parser = argparse.ArgumentParser(description="Build a database of winnable solitaire deals.")
+    parser.add_argument("--count", type=int, default=10000, help="how many deals to solve")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first deal")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--out", default="deals.db", help="database file to write")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+    # Checked before solving anything, the records only hold unsigned 64 bit seeds
+    if args.first_seed < 0 or args.first_seed + args.count > 2 ** 64:
+        parser.error("seeds have to be from 0 to 2**64 - 1")
+
+    # Only building needs the solver, the game just reads the file
+    import simulate
+
+    results = []
+
+    def collect(chunk):
+        results.extend((result["seed"], result["won"], result["moves"]) for result in chunk)
+
+    start = time.perf_counter()
+    played, won = simulate.simulate("solver", args.count, args.first_seed, args.workers, collect, variant)
+    write_database(args.out, results, variant)
+    unknown = sum(won is None for _, won, _ in results)
+    print(f"{won} of {played} deals winnable ({unknown} the solver gave up on), written to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
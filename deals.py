@@ -0,0 +1,57 @@
+"""
+Seeded, reproducible deals.
+
+A seed always gives the same deal, so seeds double as deal IDs for replays,
+benchmarks and daily challenges. A deal is the order of the 52 card ints (see
+rules.py) in the face down pile before the tableaus are dealt, last card on top.
+"""
+import random
+
+DECK_SIZE = 52
+
+# Seeds handed out for new games fit in 32 bits so they are easy to read out and type in
+SEED_LIMIT = 2 ** 32
+
+
+def new_seed():
+    """ A fresh random seed for a new game """
+    return random.SystemRandom().randrange(SEED_LIMIT)
+
+
+def daily_seed(day):
+    """ Seed of the daily challenge for a date, e.g. 20261018 """
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def deal(seed, size=DECK_SIZE):
+    """
+    The deck for a seed: an unbiased Fisher-Yates shuffle of 0..size-1 driven by
+    its own random.Random, so nothing else touching the random module changes it.
+    """
+    rng = random.Random(seed)
+    deck = list(range(size))
+    for i in range(size - 1, 0, -1):
+        j = rng.randrange(i + 1)
+        deck[i], deck[j] = deck[j], deck[i]
+    return deck
+
+
+def deal_batch(count, seed, size=DECK_SIZE):
+    """
+    `count` decks at once as a (count, size) uint8 NumPy array, shuffled with the
+    same Fisher-Yates swaps run on every row together.
+
+    The rows come from one NumPy generator for the whole batch, so a deal in a
+    batch is identified by (seed, row) and is not the same as deal(seed).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    decks = np.tile(np.arange(size, dtype=np.uint8), (count, 1))
+    rows = np.arange(count)
+    for i in range(size - 1, 0, -1):
+        j = rng.integers(0, i + 1, size=count)
+        swapped = decks[rows, j]
+        decks[rows, j] = decks[:, i]
+        decks[:, i] = swapped
+    return decks
@@ -0,0 +1,146 @@
+"""
+Hints for the game, searched for on a background thread.
+
+The engine keeps its solver, and with it the transposition table, for the
+whole game. Every winning line it finds is remembered by the hash of each
+position along it, so as long as the player follows the line (or undoes back
+onto it) the next hint is a dictionary lookup. When the player leaves the
+line, a new search starts from where they are and skips every state the
+earlier searches already found no win under.
+"""
+import os
+import sys
+import threading
+import traceback
+
+import solver
+
+# How far the search thread's priority is lowered, on the nice scale
+SEARCH_NICENESS = 19
+
+
+class HintEngine:
+    """ Background solver that keeps a hint ready for the position it was last shown """
+
+    def __init__(self, max_nodes=solver.DEFAULT_MAX_NODES):
+        self.solver = solver.Solver(max_nodes=max_nodes)
+
+        # Winning move from each position on the lines found so far, by state hash
+        self.line = {}
+
+        # Fallback for positions the solver gave up on or found no win from
+        self.best_guess = {}
+
+        # Position waiting to be searched, as (hash, state), and the one being searched
+        self.wanted = None
+        self.searching = None
+
+        self.cancel = threading.Event()
+        self.wake = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="hints", daemon=True)
+            self.thread.start()
+
+    def new_game(self):
+        """
+        Stop searching the last game. The transposition table is kept: a position
+        with no win in it has none whichever deal it came from.
+        """
+        with self.wake:
+            self.cancel.set()
+            self.wanted = None
+            self.line = {}
+            self.best_guess = {}
+
+    def update(self, state):
+        """
+        Tell the engine about the position on the table, after every move or undo.
+        If there is no hint for it yet, a search is started in the background.
+        """
+        key = solver.zobrist_hash(state)
+        if key in self.line or key in self.best_guess:
+            return
+        with self.wake:
+            if self.searching == key:
+                return
+            # Whatever was being searched is out of date now
+            self.cancel.set()
+            self.wanted = key, state.copy()
+            self.wake.notify()
+        self.start()
+
+    def hint(self, state):
+        """
+        Move to play from `state`, or None if the search hasn't got there yet.
+        Also returns whether the move is part of a known win.
+        """
+        key = solver.zobrist_hash(state)
+        if key in self.line:
+            return self.line[key], True
+        return self.best_guess.get(key), False
+
+    def winning_line(self, state):
+        """
+        Moves of a known win from `state` to the end of the game, [] if the search
+        from `state` ended without finding one, or None while it is still going.
+        """
+        key = solver.zobrist_hash(state)
+        if key not in self.line:
+            return [] if key in self.best_guess else None
+        state = state.copy()
+        moves = []
+        while key in self.line:
+            move = self.line[key]
+            moves.append(move)
+            key, _ = solver.hash_move(state, key, move)
+        return moves
+
+    def _run(self):
+        # Let the OS run the game thread first, so a search never costs frames.
+        # Only Linux can lower the priority of a single thread: elsewhere setpriority()
+        # takes a process id, and the thread id could be some other process.
+        if sys.platform.startswith("linux"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SEARCH_NICENESS)
+            except OSError as error:
+                print(f"Hint search runs at normal priority: {error}")
+
+        while True:
+            with self.wake:
+                while self.wanted is None:
+                    self.wake.wait()
+                key, state = self.wanted
+                self.wanted = None
+                self.searching = key
+                self.cancel.clear()
+
+            try:
+                result = self.solver.solve(state, self.cancel)
+            except Exception:
+                # One bad search mustn't kill the thread, or the game waits on it for ever.
+                # The table might hold states the search never finished, so it goes too.
+                traceback.print_exc()
+                self.solver.table.clear()
+                result = solver.SolveResult(False, [], 0)
+
+            with self.wake:
+                self.searching = None
+                if result.won:
+                    self._remember_line(key, state, result.moves)
+                elif result.won is False or not self.cancel.is_set():
+                    # No win to point at, so suggest the move the solver would try first.
+                    # None is remembered too, so a stuck position isn't searched again.
+                    moves = solver.ordered_moves(state)
+                    self.best_guess[key] = moves[0] if moves else None
+
+    def _remember_line(self, key, state, moves):
+        """ Record the winning move from each position along a line """
+        line = dict(self.line)
+        for move in moves:
+            line[key] = move
+            key, _ = solver.hash_move(state, key, move)
+        # Swapped in whole, so the game thread never sees it half built
+        self.line = line
@@ -0,0 +1,49 @@
+"""
+Undo and redo.
+
+Every change to a game is kept as a small delta, the move plus whether it
+turned a card face up, rather than a copy of the board. Undoing or redoing one
+only touches the cards that moved.
+"""
+import rules
+
+
+class MoveLog:
+    """ Moves made in a game, with the ones undone kept for redo """
+
+    def __init__(self):
+        # (move, flipped) deltas, oldest first
+        self.done = []
+        self.undone = []
+
+    def __len__(self):
+        return len(self.done)
+
+    def apply(self, state, move):
+        """ Make a move and log it. A new move throws away anything that could be redone. """
+        flipped = rules.apply(state, move)
+        self.done.append((move, flipped))
+        self.undone.clear()
+        return flipped
+
+    def undo(self, state):
+        """ Take back the last move. Returns its (move, flipped) delta, or None if there's nothing to undo. """
+        if not self.done:
+            return None
+        delta = self.done.pop()
+        rules.undo(state, *delta)
+        self.undone.append(delta)
+        return delta
+
+    def redo(self, state):
+        """ Make the last undone move again. Returns its (move, flipped) delta, or None if there's nothing to redo. """
+        if not self.undone:
+            return None
+        move, flipped = self.undone.pop()
+        rules.apply(state, move)
+        self.done.append((move, flipped))
+        return move, flipped
+
+    def moves(self):
+        """ The moves made so far, in order """
+        return [move for move, _ in self.done]
@@ -0,0 +1,41 @@
+"""
+Scoreboard drawn on top of the game.
+
+The text objects are kept between frames and only laid out again when the
+value they show changes, instead of building new text every frame.
+"""
+import arcade
+
+HUD_COLOR = arcade.color.WHITE
+
+
+class Hud:
+    """ Score, play time, move count and cards left in the face down pile """
+
+    def __init__(self, x=750, y=50):
+        self.score_text = arcade.Text("", x, y, HUD_COLOR, 30)
+        self.stock_text = arcade.Text("", x, y + 50, HUD_COLOR, 16)
+        self.moves_text = arcade.Text("", x, y + 75, HUD_COLOR, 16)
+        self.time_text = arcade.Text("", x, y + 100, HUD_COLOR, 16)
+        self.texts = [self.score_text, self.stock_text, self.moves_text, self.time_text]
+
+        # Last value shown by each text, so unchanged values skip formatting too
+        self.shown = {}
+
+    def _show(self, text, value, label):
+        if self.shown.get(text) == value:
+            return
+        self.shown[text] = value
+        text.text = label
+
+    def update(self, score, seconds, moves, stock):
+        """ Refresh the values shown. Only the texts whose value changed get laid out again. """
+        self._show(self.score_text, score, f"Score: {score}")
+        seconds = int(seconds)
+        self._show(self.time_text, seconds, f"Time: {seconds // 60}:{seconds % 60:02d}")
+        self._show(self.moves_text, moves, f"Moves: {moves}")
+        self._show(self.stock_text, stock, f"Stock: {stock}")
+
+    def draw(self):
+        for text in self.texts:
+            text.draw()
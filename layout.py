@@ -0,0 +1,154 @@
+"""
+Where everything goes on the screen, and the reverse: which pile and card is
+under a point.
+
+Hit testing works straight from the layout constants and the piles in the game
+state (see rules.py), so it costs the same no matter how many cards there are,
+two decks' worth included. No arcade in here either.
+"""
+from functools import lru_cache
+
+from rules import BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE, DEFAULT_VARIANT, PLAY_PILE_1
+
+# Screen title and size
+SCREEN_WIDTH = 1067
+SCREEN_HEIGHT = 800
+SCREEN_TITLE = "Slithery Solitaire"
+
+# Constants for sizing
+CARD_SCALE = 0.6
+
+# How big are the cards?
+CARD_WIDTH = 140 * CARD_SCALE
+CARD_HEIGHT = 190 * CARD_SCALE
+
+# How big is the mat we'll place the card on?
+MAT_PERCENT_OVERSIZE = 1.25
+MAT_HEIGHT = int(CARD_HEIGHT * MAT_PERCENT_OVERSIZE)
+MAT_WIDTH = int(CARD_WIDTH * MAT_PERCENT_OVERSIZE)
+
+# How much space do we leave as a gap between the mats?
+# Done as a percent of the mat size.
+VERTICAL_MARGIN_PERCENT = 0.10
+HORIZONTAL_MARGIN_PERCENT = 0.10
+
+# The Y of the bottom row (2 piles)
+BOTTOM_Y = MAT_HEIGHT / 2 + MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
+
+# The X of where to start putting things on the left side
+START_X = MAT_WIDTH / 2 + MAT_WIDTH * HORIZONTAL_MARGIN_PERCENT
+
+"""Constants for card mats -- using calculations instead of hard values so it can scale and be changed easily."""
+# The Y of the top row (4 piles)
+TOP_Y = SCREEN_HEIGHT - MAT_HEIGHT / 2 - MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
+
+# The Y of the middle row (7 piles)
+MIDDLE_Y = TOP_Y - MAT_HEIGHT - MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
+
+# How far apart each pile goes
+X_SPACING = MAT_WIDTH + MAT_WIDTH * HORIZONTAL_MARGIN_PERCENT
+
+# fanned card spacing
+CARD_VERTICAL_OFFSET = CARD_HEIGHT * CARD_SCALE * 0.3
+
+
+@lru_cache(maxsize=None)
+def rows(variant=DEFAULT_VARIANT):
+    """ The piles in each row, left to right, and the Y of that row """
+    return [
+        (TOP_Y, list(variant.foundations)),
+        (MIDDLE_Y, list(variant.tableaus)),
+        (BOTTOM_Y, [BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE]),
+    ]
+
+
+@lru_cache(maxsize=None)
+def pile_positions(variant=DEFAULT_VARIANT):
+    """ Center of the mat of every pile, by pile index """
+    positions = [None] * variant.pile_count
+    for row_y, row in rows(variant):
+        for column, pile_index in enumerate(row):
+            positions[pile_index] = START_X + column * X_SPACING, row_y
+    return positions
+
+
+def screen_width(variant=DEFAULT_VARIANT):
+    """ Window width that fits every row of a variant, SCREEN_WIDTH at the least """
+    columns = max(len(row) for _, row in rows(variant))
+    return max(SCREEN_WIDTH, int(2 * START_X + (columns - 1) * X_SPACING))
+
+
+def pile_position(pile_index, variant=DEFAULT_VARIANT):
+    """ Center of the mat for a pile """
+    if not 0 <= pile_index < variant.pile_count:
+        raise ValueError(f"No pile {pile_index}")
+    return pile_positions(variant)[pile_index]
+
+
+def card_position(state, pile_index, card_index):
+    """
+    Where a card in a pile goes. Cards sit right on their mat, except face up
+    cards on the middle play piles, which fan downwards from the first face up one.
+    """
+    x, y = pile_position(pile_index, state.variant)
+    if PLAY_PILE_1 <= pile_index <= state.variant.last_tableau:
+        y -= max(0, card_index - state.face_down[pile_index]) * CARD_VERTICAL_OFFSET
+    return x, y
+
+
+def _column_at(x):
+    """ Column closest to an X, and how far off its center that is """
+    column = max(0, round((x - START_X) / X_SPACING))
+    return column, x - (START_X + column * X_SPACING)
+
+
+def card_at_point(state, x, y):
+    """
+    The top card under a point, as (pile index, card index). The card index is
+    None for a click on an empty part of a mat. None if there's no mat or card there.
+    """
+    column, dx = _column_at(x)
+
+    for row_y, row in rows(state.variant):
+        if column >= len(row):
+            continue
+        pile_index = row[column]
+        pile = state.piles[pile_index]
+
+        if PLAY_PILE_1 <= pile_index <= state.variant.last_tableau and pile and abs(dx) <= CARD_WIDTH / 2:
+            # Highest card whose top edge is above the point, then check the point is above its bottom edge
+            face_down = state.face_down[pile_index]
+            below_top = row_y + CARD_HEIGHT / 2 - y
+            if below_top >= 0:
+                card_index = min(len(pile) - 1, face_down + int(below_top // CARD_VERTICAL_OFFSET))
+                if card_position(state, pile_index, card_index)[1] - CARD_HEIGHT / 2 <= y:
+                    return pile_index, card_index
+
+        elif pile and abs(dx) <= CARD_WIDTH / 2 and abs(y - row_y) <= CARD_HEIGHT / 2:
+            return pile_index, len(pile) - 1
+
+        if abs(dx) <= MAT_WIDTH / 2 and abs(y - row_y) <= MAT_HEIGHT / 2:
+            return pile_index, None
+
+    return None
+
+
+def drop_pile(x, y, variant=DEFAULT_VARIANT):
+    """
+    Pile to drop a card centered at (x, y) on: the closest mat, as long as the
+    card touches it. None if it isn't touching any.
+    """
+    column, dx = _column_at(x)
+    closest = None
+    for row_y, row in rows(variant):
+        if column >= len(row):
+            continue
+        dy = y - row_y
+        if closest is None or abs(dy) < closest[0]:
+            closest = abs(dy), row[column]
+
+    if closest is None:
+        return None
+    if abs(dx) < (CARD_WIDTH + MAT_WIDTH) / 2 and closest[0] < (CARD_HEIGHT + MAT_HEIGHT) / 2:
+        return closest[1]
+    return None
@@ -0,0 +1,140 @@
+"""
+Monte Carlo move evaluator: how likely each move is to lead to a win.
+
+The cards the player can't see, the face down tableau cards and the face down
+pile, are dealt out again at random into the same spots. Every legal move is
+then made in each of those deals and played out greedily (see batch.py), all
+the playouts for all the moves at once. A move's win probability is the share
+of its playouts that were won. Every move sees the same deals, so the
+differences between moves are not just luck of the deal.
+
+Playing fair, nothing hidden is looked at, which makes for hints a player
+could have worked out. Peeking plays out the real deal instead, for offline
+analysis:
+
+    python montecarlo.py --seed 7 --budget 2
+"""
+import argparse
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+import deals
+import rules
+from batch import BatchGames, greedy_playouts
+from rules import BOTTOM_FACE_DOWN_PILE
+
+# Seconds to spend on an evaluation, and on a fair hint in the game
+DEFAULT_BUDGET = 0.2
+
+# Deals of the hidden cards played out per move in one go. More is cheaper per
+# playout, fewer leaves more chances to stop on time.
+SAMPLES_PER_ROUND = 32
+
+# Playouts are cut off after this many moves; greedy ones rarely get near it
+PLAYOUT_MAX_MOVES = 300
+
+
+class MoveValue(NamedTuple):
+    """
+    How a move did: the share of its playouts won, how many there were, and
+    the average number of cards they got onto the foundations, which breaks
+    ties between moves that never won.
+    """
+    move: rules.Move
+    win_probability: float
+    playouts: int
+    foundation_cards: float
+
+
+def hidden_spots(state):
+    """ (pile, index in pile) of every card the player can't see """
+    spots = [(pile_no, index) for pile_no in state.variant.tableaus for index in range(state.face_down[pile_no])]
+    spots += [(BOTTOM_FACE_DOWN_PILE, index) for index in range(len(state.piles[BOTTOM_FACE_DOWN_PILE]))]
+    return spots
+
+
+def sample_hidden(state, count, rng):
+    """
+    `count` deals of the hidden cards, as a (count, spots) array in
+    hidden_spots() order. Each is the same cards as the real deal, shuffled.
+    """
+    cards = np.array([state.piles[pile_no][index] for pile_no, index in hidden_spots(state)], dtype=np.uint8)
+    return rng.permuted(np.tile(cards, (count, 1)), axis=1)
+
+
+def evaluate_moves(state, budget=DEFAULT_BUDGET, fair=True, rng=None, samples_per_round=SAMPLES_PER_ROUND):
+    """
+    MoveValue for every legal move from `state`, best first, after spending about
+    `budget` seconds on playouts. With `fair` off the hidden cards are left where
+    they really are, and only the greedy player's choices between equal moves vary.
+    """
+    deadline = time.perf_counter() + budget
+    rng = rng or np.random.default_rng()
+    moves = list(dict.fromkeys(rules.legal_moves(state)))
+    if not moves:
+        return []
+
+    base = BatchGames.from_states([state])
+    actions = np.array([base.actions.number(move) for move in moves])
+    counts = np.array([move.count for move in moves], dtype=np.int16)
+    spots = hidden_spots(state)
+    spot_piles = np.array([pile_no for pile_no, _ in spots], dtype=np.intp)
+    spot_indexes = np.array([index for _, index in spots], dtype=np.intp)
+
+    wins = np.zeros(len(moves))
+    foundation_cards = np.zeros(len(moves))
+    playouts = 0
+    round_time = 0.0
+    while not playouts or time.perf_counter() + round_time < deadline:
+        start = time.perf_counter()
+
+        # Game row move * samples + sample: every move gets the same deals
+        games = base.take(np.zeros(len(moves) * samples_per_round, dtype=np.intp))
+        if fair and spots:
+            games.cards[:, spot_piles, spot_indexes] = np.tile(sample_hidden(state, samples_per_round, rng),
+                                                               (len(moves), 1))
+        games.apply(np.repeat(actions, samples_per_round), np.repeat(counts, samples_per_round),
+                    np.ones(len(games), dtype=bool))
+        greedy_playouts(games, PLAYOUT_MAX_MOVES, rng, deadline)
+
+        wins += games.won().reshape(len(moves), samples_per_round).sum(axis=1)
+        foundation_cards += games.lengths[:, games.foundations].sum(axis=1).reshape(len(moves), -1).sum(axis=1)
+        playouts += samples_per_round
+        round_time = time.perf_counter() - start
+
+    values = [MoveValue(move, float(wins[i] / playouts), playouts, float(foundation_cards[i] / playouts))
+              for i, move in enumerate(moves)]
+    values.sort(key=lambda value: (value.win_probability, value.foundation_cards), reverse=True)
+    return values
+
+
+def best_move(state, budget=DEFAULT_BUDGET, fair=True, rng=None):
+    """ The best MoveValue from evaluate_moves(), or None with no legal moves """
+    values = evaluate_moves(state, budget, fair, rng)
+    return values[0] if values else None
+
+
+def main(argv=None):
+    """ Command line entry point: evaluate the moves at the start of a deal """
+    parser = argparse.ArgumentParser(description="Win probability of every move at the start of a deal.")
+    parser.add_argument("--seed", type=int, required=True, help="deal to evaluate")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds to spend")
+    parser.add_argument("--peek", action="store_true", help="play out the real hidden cards instead of guesses")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    state = rules.new_game(deals.deal(args.seed, variant.deck_size), variant)
+    for value in evaluate_moves(state, args.budget, fair=not args.peek, rng=np.random.default_rng(args.seed)):
+        src, dst, count = value.move
+        print(f"{src:2} -> {dst:2} x{count:<2}  win {value.win_probability:6.1%}  "
+              f"foundations {value.foundation_cards:4.1f}  ({value.playouts} playouts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Parallel Klondike solver: the depth-first search of solver.py spread over
+worker processes, for the hard deals that take a single solver minutes.
+
+The first few levels of the game tree are expanded here, until there are a
+few subtrees for every worker, and the subtrees are queued up for the workers
+to take as they come free. Klondike's search is very uneven though, and most
+of the work can sit under one or two of them. So whenever a worker is left
+with nothing to do, a busy one hands the untried moves nearest its root back
+to the queue (see Solver.solve()'s splitter), and deep subtrees keep getting
+split for as long as anyone is idle.
+
+The workers share a table of states that have been searched right through
+without a win, in shared memory, so a position reached in two subtrees is
+only searched once. They also share the node budget. As soon as one worker
+wins the rest are cancelled.
+
+    python parallel_solver.py --seed 7 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import deals
+import rules
+import solver
+
+# Slots in the shared table, and how many slots a state can go in
+DEFAULT_SHARED_SLOTS = 1 << 22
+BUCKET_SIZE = 4
+
+# Subtrees queued up per worker to start with. Busy workers split off more
+# as others go idle.
+TASKS_PER_WORKER = 4
+
+# Seconds the coordinator waits for a result or a donated subtree at a time
+POLL_TIME = 0.05
+
+
+class SharedTable:
+    """
+    Fixed size set of state hashes in shared memory, that every worker process
+    reads and writes without locking. A hash can go in any of the BUCKET_SIZE
+    slots of its bucket, and throws out whatever was in its slot when the bucket
+    is full, so the table forgets things but never fills up.
+
+    Slots are aligned 64 bit words, which the CPU reads and writes in one go,
+    so a race between two workers can lose an entry but never corrupt one. And
+    losing an entry only means searching that state again.
+    """
+
+    def __init__(self, slots=DEFAULT_SHARED_SLOTS, name=None):
+        self.buckets = slots // BUCKET_SIZE
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.buckets * BUCKET_SIZE * 8)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.slots = self.memory.buf.cast("Q")
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def _bucket(self, key):
+        # 0 marks an empty slot, so a hash of 0 is stored as 1
+        key = key or 1
+        return key, key % self.buckets * BUCKET_SIZE
+
+    def __contains__(self, key):
+        key, start = self._bucket(key)
+        slots = self.slots
+        for slot in range(start, start + BUCKET_SIZE):
+            if slots[slot] == key:
+                return True
+        return False
+
+    def add(self, key):
+        """ Remember a state hash """
+        key, start = self._bucket(key)
+        slots = self.slots
+        for slot in range(start, start + BUCKET_SIZE):
+            if slots[slot] == key:
+                return
+            if not slots[slot]:
+                slots[slot] = key
+                return
+        # Full bucket: pick a slot by the hash's high bits, not the ones that chose the bucket
+        slots[start + (key >> 60) % BUCKET_SIZE] = key
+
+    def close(self, unlink=False):
+        """ Detach from the shared memory, and free it if `unlink` """
+        self.slots.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+# Set in each worker process by _init_worker(): the shared table, the cancel
+# event, the event saying a worker is idle, the queue of subtrees given away
+# and the count of nodes used by every worker together
+_shared = None
+_cancel = None
+_hungry = None
+_donations = None
+_nodes_used = None
+
+
+def _init_worker(table_name, cancel, hungry, donations, nodes_used):
+    global _shared, _cancel, _hungry, _donations, _nodes_used
+    _shared = SharedTable(name=table_name)
+    _cancel = cancel
+    _hungry = hungry
+    _donations = donations
+    _nodes_used = nodes_used
+    # Donations nobody will read, once there's a win, mustn't keep the worker from exiting
+    donations.cancel_join_thread()
+
+
+class _Budget:
+    """
+    The cancel event a worker's Solver checks: set once the search is cancelled
+    or the workers between them have used up the node budget. The solver checks
+    it every CANCEL_CHECK_NODES nodes, so each check counts as that many.
+    """
+
+    def __init__(self, max_nodes):
+        self.max_nodes = max_nodes
+
+    def is_set(self):
+        with _nodes_used.get_lock():
+            _nodes_used.value += solver.CANCEL_CHECK_NODES
+            used = _nodes_used.value
+        return used >= self.max_nodes or _cancel.is_set()
+
+
+class _Splitter:
+    """ Hands a worker's untried moves to the queue when another worker is idle """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.given = 0
+
+    def wanted(self):
+        return _hungry.is_set()
+
+    def give(self, lines):
+        # One worker feeding the idle ones is enough, the coordinator asks again if not
+        _hungry.clear()
+        for line in lines:
+            _donations.put(self.prefix + line)
+        self.given += len(lines)
+
+
+def _solve_subtree(state, prefix, table_size, max_nodes):
+    """
+    Worker task: search on from `state` after the moves in `prefix`. Returns the
+    SolveResult, its moves from `state`, and how many subtrees were given away.
+    """
+    budget = _Budget(max_nodes)
+    if budget.is_set():
+        return solver.SolveResult(None, [], 0), 0
+    for move in prefix:
+        rules.apply(state, move)
+    splitter = _Splitter(prefix)
+    result = solver.Solver(table_size, max_nodes, _shared).solve(state, budget, splitter)
+    # The nodes since the last budget check
+    with _nodes_used.get_lock():
+        _nodes_used.value += result.nodes % solver.CANCEL_CHECK_NODES
+    if result.won:
+        result = solver.SolveResult(True, prefix + result.moves, result.nodes)
+    return result, splitter.given
+
+
+def split(state, count):
+    """
+    Expand the game tree breadth first from `state` until there are at least
+    `count` positions to search from, or nothing left to expand. Returns
+    (won, prefixes, nodes): the winning line if expanding happened on a win,
+    the move lists leading to each position, in the order a depth-first search
+    would get to them, and how many positions were looked at.
+    """
+    seen = {solver.canonical_hash(state)}
+    # Each entry is (index of each move among its siblings, moves), the indexes
+    # sorting the positions back into depth-first order at the end
+    frontier = deque([((), [])])
+    nodes = 0
+    while frontier and len(frontier) < count:
+        order, prefix = frontier.popleft()
+        position = state.copy()
+        for move in prefix:
+            rules.apply(position, move)
+        for index, move in enumerate(solver.ordered_moves(position)):
+            flipped = rules.apply(position, move)
+            nodes += 1
+            if position.is_won():
+                return prefix + [move], [], nodes
+            key = solver.canonical_hash(position)
+            if key not in seen:
+                seen.add(key)
+                frontier.append((order + (index,), prefix + [move]))
+            rules.undo(position, move, flipped)
+    return None, [prefix for _, prefix in sorted(frontier, key=lambda entry: entry[0])], nodes
+
+
+def solve(state, workers=None, table_size=solver.DEFAULT_TABLE_SIZE, max_nodes=solver.DEFAULT_MAX_NODES,
+          shared_slots=DEFAULT_SHARED_SLOTS):
+    """
+    Solve a position over worker processes. Returns a solver.SolveResult, with
+    `nodes` counted over every worker. `max_nodes` is shared by all the workers,
+    so it is the same budget as solver.solve()'s; `table_size` is for the
+    transposition table of each subtree's Solver.
+    """
+    workers = workers or os.cpu_count() or 1
+    state = state.copy()
+    if state.is_won():
+        return solver.SolveResult(True, [], 0)
+
+    won, prefixes, nodes = split(state, workers * TASKS_PER_WORKER)
+    if won is not None:
+        return solver.SolveResult(True, won, nodes)
+
+    table = SharedTable(shared_slots)
+    cancel = multiprocessing.Event()
+    hungry = multiprocessing.Event()
+    donations = multiprocessing.Queue()
+    nodes_used = multiprocessing.Value("q", nodes)
+    out_of_nodes = False
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(table.name, cancel, hungry, donations, nodes_used)) as executor:
+            pending = set()
+
+            def submit(prefix):
+                pending.add(executor.submit(_solve_subtree, state, prefix, table_size, max_nodes))
+
+            for prefix in prefixes:
+                submit(prefix)
+
+            # Subtrees the workers said they gave away, and how many of them have arrived.
+            # A task can finish before its donations come out of the queue.
+            promised = received = 0
+            while pending or received < promised:
+                done = set()
+                if pending:
+                    done, pending = wait(pending, timeout=POLL_TIME, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, given = future.result()
+                    nodes += result.nodes
+                    promised += given
+                    if result.won:
+                        # Stop the running searches, and the queued ones before they start
+                        cancel.set()
+                        for other in pending:
+                            other.cancel()
+                        return solver.SolveResult(True, result.moves, nodes)
+                    out_of_nodes = out_of_nodes or result.won is None
+
+                try:
+                    while True:
+                        submit(donations.get(block=not pending, timeout=POLL_TIME))
+                        received += 1
+                except queue.Empty:
+                    pass
+
+                # Fewer tasks than workers means someone is idle: ask for a subtree
+                if len(pending) < workers and not out_of_nodes:
+                    hungry.set()
+                else:
+                    hungry.clear()
+    finally:
+        table.close(unlink=True)
+
+    # A subtree that ran out of nodes might have held the win
+    return solver.SolveResult(None if out_of_nodes else False, [], nodes)
+
+
+def main(argv=None):
+    """ Command line entry point: solve one deal """
+    parser = argparse.ArgumentParser(description="Solve a solitaire deal over several worker processes.")
+    parser.add_argument("--seed", type=int, required=True, help="deal to solve")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-nodes", type=int, default=solver.DEFAULT_MAX_NODES,
+                        help="positions the workers can look at between them before giving up")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    state = rules.new_game(deals.deal(args.seed, variant.deck_size), variant)
+    start = time.perf_counter()
+    result = solve(state, args.workers, max_nodes=args.max_nodes)
+    elapsed = time.perf_counter() - start
+    outcome = {True: f"won in {len(result.moves)} moves", False: "not winnable", None: "gave up"}[result.won]
+    print(f"Seed {args.seed}: {outcome}, {result.nodes} positions in {elapsed:.1f}s", file=sys.stderr)
+    for move in result.moves:
+        print(*move)
+
+
+if __name__ == "__main__":
+    main()
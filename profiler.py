@@ -0,0 +1,151 @@
+"""
+Frame time and input latency profiling for SolitaireGame.
+
+Press F3 in the game to turn it on. While on, the time spent in each hooked
+method is recorded and a rolling frame time graph with p50/p99 is drawn in the
+corner. Per-hook histograms are written to a JSON file when the window closes.
+"""
+import json
+import time
+from collections import deque
+
+import arcade
+
+# Methods of the window that get timed
+HOOKS = ["on_draw", "on_update", "on_mouse_press", "on_mouse_release", "on_mouse_motion", "lift_cards", "setup"]
+
+# Upper edges of the histogram buckets, in milliseconds. Anything slower goes in the last bucket.
+BUCKET_EDGES_MS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16.7, 33.3, 66.7, 100, 250]
+
+# How many frames the rolling graph shows
+FRAME_WINDOW = 240
+
+# Where the graph goes and how tall it is, 1 pixel per this many ms
+GRAPH_X = 10
+GRAPH_Y = 10
+GRAPH_HEIGHT = 100
+GRAPH_MS_PER_PIXEL = 0.5
+
+
+def percentile(values, fraction):
+    """ Value below which `fraction` of `values` fall (nearest rank) """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Histogram:
+    """ Bucketed timings for one hook """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        bucket = 0
+        while bucket < len(BUCKET_EDGES_MS) and ms > BUCKET_EDGES_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "buckets_ms": BUCKET_EDGES_MS + ["inf"],
+            "counts": self.counts,
+        }
+
+
+class Profiler:
+    """
+    Times hooked methods on a window. Turning it off puts the original methods
+    back, so it costs nothing when it isn't in use.
+    """
+
+    def __init__(self, window, hooks=HOOKS):
+        self.window = window
+        self.hooks = hooks
+        self.enabled = False
+        self.histograms = {name: Histogram() for name in hooks}
+
+        # Time between the starts of consecutive frames, in ms
+        self.frame_times = deque(maxlen=FRAME_WINDOW)
+        self.last_frame_start = None
+
+        self.stats_text = arcade.Text("", GRAPH_X, GRAPH_Y + GRAPH_HEIGHT + 5, arcade.color.YELLOW, 12)
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        """ Start timing the hooks """
+        if self.enabled:
+            return
+        for name in self.hooks:
+            setattr(self.window, name, self._wrap(name, getattr(self.window, name)))
+        self.last_frame_start = None
+        self.enabled = True
+
+    def disable(self):
+        """ Stop timing and put the original methods back """
+        if not self.enabled:
+            return
+        for name in self.hooks:
+            # The wrappers live on the instance, dropping them uncovers the class methods
+            delattr(self.window, name)
+        self.enabled = False
+
+    def _wrap(self, name, method):
+        histogram = self.histograms[name]
+        is_frame = name == "on_draw"
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            if is_frame:
+                if self.last_frame_start is not None:
+                    self.frame_times.append((start - self.last_frame_start) * 1000)
+                self.last_frame_start = start
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.add((time.perf_counter() - start) * 1000)
+
+        return timed
+
+    def draw(self):
+        """ Draw the frame time graph and p50/p99 """
+        if not self.enabled or not self.frame_times:
+            return
+
+        # One line per frame, the newest on the right
+        points = []
+        for i, ms in enumerate(self.frame_times):
+            x = GRAPH_X + i
+            points.append((x, GRAPH_Y))
+            points.append((x, GRAPH_Y + min(GRAPH_HEIGHT, ms / GRAPH_MS_PER_PIXEL)))
+        arcade.draw_lines(points, arcade.color.YELLOW)
+
+        # 60 fps line
+        target_y = GRAPH_Y + 16.7 / GRAPH_MS_PER_PIXEL
+        arcade.draw_line(GRAPH_X, target_y, GRAPH_X + FRAME_WINDOW, target_y, arcade.color.RED)
+
+        self.stats_text.text = (f"frame p50 {percentile(self.frame_times, 0.5):.1f} ms  "
+                                f"p99 {percentile(self.frame_times, 0.99):.1f} ms")
+        self.stats_text.draw()
+
+    def dump(self, file_name=None):
+        """ Write the per-hook histograms to a JSON file, if anything was recorded. Returns the file name. """
+        if not any(histogram.count for histogram in self.histograms.values()):
+            return None
+        file_name = file_name or time.strftime("profile_%Y%m%d_%H%M%S.json")
+        with open(file_name, "w") as file:
+            json.dump({name: histogram.to_dict() for name, histogram in self.histograms.items()}, file, indent=2)
+        return file_name
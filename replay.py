@@ -0,0 +1,227 @@
+"""
+Compact binary replays.
+
+A replay file is the magic bytes, then any number of games back to back. A
+game is its deal seed and its variant's four settings (see rules.Variant, the
+recycle limit stored one up so 0 means none) as varints, one entry per move,
+and an end byte. A move is one byte for its (src, dst) pile pair, or a byte
+each in variants with too many piles for that. A varint card count follows only
+when a run moves between two play piles; every other count follows from the
+rules. Undos get their own byte, so a redo is just the move again. Most moves
+take one byte.
+
+Files are only ever appended to, so a game cut off halfway is still readable
+up to its last whole move (and comes back not valid if the cut was in the
+middle of one). replay() reads one back through the headless rules without
+any GUI:
+
+    for game in replay("games.rpl"):
+        print(game.seed, game.valid, game.state.is_won())
+"""
+import mmap
+import os
+from typing import NamedTuple
+
+import deals
+import rules
+from history import MoveLog
+from rules import BOTTOM_FACE_DOWN_PILE, DEFAULT_VARIANT, PLAY_PILE_1
+
+MAGIC = b"SOLR\x02"
+
+# Pile pairs take 0..168 in the standard game, leaving these for markers
+UNDO = 0xFE
+END_GAME = 0xFF
+
+
+def write_varint(out, value):
+    """ Append an unsigned int as a little-endian base 128 varint """
+    if value < 0:
+        raise ValueError(f"varints are unsigned, can't write {value}")
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    """ Read a varint at `offset`, returns (value, offset after it). EOFError if the data ends first. """
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise EOFError("varint runs past the end of the data")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _count_is_written(src, dst, variant):
+    return PLAY_PILE_1 <= src <= variant.last_tableau and PLAY_PILE_1 <= dst <= variant.last_tableau
+
+
+def _pair_fits_byte(variant):
+    """ Can a (src, dst) pair be written as one byte in this variant? """
+    return variant.pile_count ** 2 <= UNDO
+
+
+def encode_move(move, variant=DEFAULT_VARIANT):
+    """ Bytes for a move """
+    src, dst, count = move
+    if _pair_fits_byte(variant):
+        out = bytearray([src * variant.pile_count + dst])
+    else:
+        out = bytearray([src, dst])
+    if _count_is_written(src, dst, variant):
+        write_varint(out, count)
+    return bytes(out)
+
+
+def _has_magic(path):
+    """ Does the file start with this format's magic bytes? """
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class ReplayWriter:
+    """ Appends games to a replay file as they are played """
+
+    def __init__(self, path, buffered=True):
+        # Unbuffered writes put every move on disk straight away, for games played by hand
+        self.file = open(path, "ab", buffering=-1 if buffered else 0)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        elif not _has_magic(path):
+            self.file.close()
+            raise ValueError(f"{path} is not a replay file in this format, record to a new file")
+        self.in_game = False
+        self.variant = DEFAULT_VARIANT
+
+    def start_game(self, seed, variant=DEFAULT_VARIANT):
+        """ Start a new game, ending the last one if it is still going. Seeds can't be negative. """
+        self.end_game()
+        out = bytearray()
+        write_varint(out, seed)
+        recycle_limit = variant.recycle_limit
+        for setting in (variant.draw_count, 0 if recycle_limit is None else recycle_limit + 1,
+                        variant.decks, variant.columns):
+            write_varint(out, setting)
+        self.file.write(out)
+        self.variant = variant
+        self.in_game = True
+
+    def move(self, move):
+        self.file.write(encode_move(move, self.variant))
+
+    def undo(self):
+        self.file.write(bytes([UNDO]))
+
+    def end_game(self):
+        if self.in_game:
+            self.file.write(bytes([END_GAME]))
+            self.in_game = False
+
+    def close(self):
+        self.end_game()
+        self.file.close()
+
+
+class ReplayedGame(NamedTuple):
+    """
+    A game read back from a replay. `state` is where it ended up (its variant is
+    state.variant), `moves` the moves left standing after undos, and `valid` says
+    whether every move was legal.
+    """
+    seed: int
+    state: rules.GameState
+    moves: list
+    valid: bool
+
+
+def _replay_game(data, offset):
+    """
+    Play back the game at `offset`. Returns the game and the offset after it, or
+    None for the game if its header is cut off or makes no sense, which leaves
+    nothing to play back.
+    """
+    try:
+        seed, offset = read_varint(data, offset)
+        settings = []
+        for _ in range(4):
+            setting, offset = read_varint(data, offset)
+            settings.append(setting)
+        draw_count, recycle_limit, decks, columns = settings
+        variant = rules.Variant(draw_count, recycle_limit - 1 if recycle_limit else None, decks, columns)
+    except (EOFError, ValueError):
+        return None, len(data)
+
+    state = rules.new_game(deals.deal(seed, variant.deck_size), variant)
+    pair_fits_byte = _pair_fits_byte(variant)
+    log = MoveLog()
+    valid = True
+
+    while offset < len(data):
+        token = data[offset]
+        offset += 1
+        if token == END_GAME:
+            break
+        if token == UNDO:
+            valid = valid and log.undo(state) is not None
+            continue
+
+        if pair_fits_byte:
+            src, dst = divmod(token, variant.pile_count)
+        elif offset < len(data):
+            src, dst = token, data[offset]
+            offset += 1
+        else:
+            # Cut off in the middle of a move
+            valid = False
+            break
+        if src >= variant.pile_count or dst >= variant.pile_count:
+            # A corrupt byte, not a move. No count follows piles that don't exist.
+            valid = False
+            continue
+        if _count_is_written(src, dst, variant):
+            try:
+                count, offset = read_varint(data, offset)
+            except EOFError:
+                valid = False
+                break
+        elif src == BOTTOM_FACE_DOWN_PILE:
+            count = len(state.piles[BOTTOM_FACE_DOWN_PILE][-variant.draw_count:])
+        elif dst == BOTTOM_FACE_DOWN_PILE:
+            count = len(state.piles[src])
+        else:
+            count = 1
+
+        # Keep reading to find the end of the game, but stop playing once a move is illegal
+        move = rules.Move(src, dst, count)
+        if valid and rules.is_legal(state, move):
+            log.apply(state, move)
+        else:
+            valid = False
+
+    return ReplayedGame(seed, state, log.moves(), valid), offset
+
+
+def replay(path):
+    """
+    Generator of every game in a replay file, each played back through the rules.
+    The file is memory mapped, so big archives are never read into memory in one go.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < len(MAGIC):
+            raise ValueError(f"{path} is not a replay file")
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a replay file")
+
+            offset = len(MAGIC)
+            while offset < len(data):
+                game, offset = _replay_game(data, offset)
+                if game is not None:
+                    yield game
@@ -0,0 +1,540 @@
+"""
+Headless Klondike rules.
+
+Nothing in here touches arcade, so the rules can be checked without opening a
+window or loading textures. The GUI in solitaire.py drives the same functions.
+"""
+from array import array
+from typing import NamedTuple
+
+import deals
+
+# Card constants
+CARD_VALUES = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
+CLUBS = "Clubs"
+HEARTS = "Hearts"
+SPADES = "Spades"
+DIAMONDS = "Diamonds"
+CARD_SUITS = [CLUBS, HEARTS, SPADES, DIAMONDS]
+BLACK_SUITS = [CLUBS, SPADES]
+RED_SUITS = [HEARTS, DIAMONDS]
+
+# A card is an int in 0..51: the rank (0 for an ace, up to 12 for a king) in the
+# high bits and the index into CARD_SUITS in the low two bits. CARD_SUITS alternates
+# black and red, so the lowest bit alone says whether a card is red.
+DECK_SIZE = len(CARD_SUITS) * len(CARD_VALUES)
+SUIT_BITS = 2
+SUIT_MASK = (1 << SUIT_BITS) - 1
+RED_BIT = 1
+
+# where them piles are @ in the standard game. Every variant (see Variant) numbers
+# its piles the same way: the two bottom piles, the tableaus, then the foundations.
+PILE_COUNT = 13
+BOTTOM_FACE_DOWN_PILE = 0
+BOTTOM_FACE_UP_PILE = 1
+PLAY_PILE_1 = 2
+PLAY_PILE_2 = 3
+PLAY_PILE_3 = 4
+PLAY_PILE_4 = 5
+PLAY_PILE_5 = 6
+PLAY_PILE_6 = 7
+PLAY_PILE_7 = 8
+TOP_PILE_1 = 9
+TOP_PILE_2 = 10
+TOP_PILE_3 = 11
+TOP_PILE_4 = 12
+
+# How many cards a click on the face down pile flips over
+DRAW_COUNT = 3
+
+KING = len(CARD_VALUES) - 1
+ACE = 0
+
+
+def card_suit(card):
+    """ Suit name of a card """
+    return CARD_SUITS[card & SUIT_MASK]
+
+
+def card_value(card):
+    """ Value name of a card ("A", "2", ... "K") """
+    return CARD_VALUES[card >> SUIT_BITS]
+
+
+def card_rank(card):
+    """ Rank of a card, 0 for an ace up to 12 for a king """
+    return card >> SUIT_BITS
+
+
+def card_is_red(card):
+    """ Is this a hearts or diamonds card? """
+    return card & RED_BIT != 0
+
+
+def make_card(suit, value):
+    """ Card int for a suit and value name """
+    return CARD_VALUES.index(value) << SUIT_BITS | CARD_SUITS.index(suit)
+
+
+class Move(NamedTuple):
+    """
+    Move `count` cards from pile `src` to pile `dst`.
+
+    Flipping cards from the face down pile and turning the face up pile back
+    over are moves between BOTTOM_FACE_DOWN_PILE and BOTTOM_FACE_UP_PILE.
+    """
+    src: int
+    dst: int
+    count: int
+
+
+class Variant:
+    """
+    Rules settings: how many cards a draw turns over, how many times the face up
+    pile can be turned back over (None for as often as you like), how many decks
+    are shuffled together and how many tableaus they're dealt onto.
+
+    The pile numbers and ranges every rules function needs are worked out once
+    here, so the rules cost the same whatever the variant.
+    """
+    __slots__ = ("draw_count", "recycle_limit", "decks", "columns",
+                 "deck_size", "pile_count", "last_tableau", "first_foundation", "tableaus", "foundations")
+
+    def __init__(self, draw_count=DRAW_COUNT, recycle_limit=None, decks=1, columns=PLAY_PILE_7 - PLAY_PILE_1 + 1):
+        if draw_count < 1 or decks < 1 or columns < 1:
+            raise ValueError("draw count, decks and columns must all be at least 1")
+        if recycle_limit is not None and recycle_limit < 0:
+            raise ValueError("recycle limit can't be negative")
+
+        self.draw_count = draw_count
+        self.recycle_limit = recycle_limit
+        self.decks = decks
+        self.columns = columns
+
+        # Cards are still 0..51, a second deck is the same cards again
+        self.deck_size = decks * DECK_SIZE
+        if columns * (columns + 1) // 2 > self.deck_size:
+            raise ValueError(f"{columns} tableaus need more than {self.deck_size} cards to deal")
+
+        # Tableaus right after the bottom piles, then a foundation per suit per deck
+        self.last_tableau = PLAY_PILE_1 + columns - 1
+        self.first_foundation = self.last_tableau + 1
+        self.pile_count = self.first_foundation + decks * len(CARD_SUITS)
+        self.tableaus = range(PLAY_PILE_1, self.last_tableau + 1)
+        self.foundations = range(self.first_foundation, self.pile_count)
+
+    def settings(self):
+        """ (draw_count, recycle_limit, decks, columns) """
+        return self.draw_count, self.recycle_limit, self.decks, self.columns
+
+    def __eq__(self, other):
+        return isinstance(other, Variant) and self.settings() == other.settings()
+
+    def __hash__(self):
+        return hash(self.settings())
+
+    def __reduce__(self):
+        return Variant, self.settings()
+
+    def __repr__(self):
+        return "Variant(draw_count={}, recycle_limit={}, decks={}, columns={})".format(*self.settings())
+
+
+# Standard Klondike, what the PILE_COUNT, TOP_PILE_4 etc. constants describe
+DEFAULT_VARIANT = Variant()
+
+VARIANTS = {
+    "klondike": DEFAULT_VARIANT,
+    "draw-one": Variant(draw_count=1),
+    # Three passes through the face down pile
+    "vegas": Variant(recycle_limit=2),
+    "double": Variant(decks=2, columns=9),
+}
+
+
+def add_variant_arguments(parser):
+    """ Command line options for picking a variant, read back with variant_from_args() """
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="klondike", help="rules to play by")
+    parser.add_argument("--draw", type=int, default=None, help="cards turned over per draw")
+    parser.add_argument("--recycle-limit", type=int, default=None,
+                        help="times the face up pile can be turned back over (default: no limit)")
+    parser.add_argument("--decks", type=int, default=None, help="decks shuffled together")
+    parser.add_argument("--columns", type=int, default=None, help="tableau piles")
+
+
+def variant_from_args(args):
+    """ The Variant picked by add_variant_arguments() options, each one overriding --variant """
+    variant = VARIANTS[args.variant]
+    settings = [args.draw, args.recycle_limit, args.decks, args.columns]
+    return Variant(*(given if given is not None else default for given, default in zip(settings, variant.settings())))
+
+
+class GameState:
+    """
+    The piles, plus how many cards at the bottom of each pile are face down, for
+    a game of some Variant.
+
+    Piles are byte arrays of card ints, and a whole state packs into a short byte
+    string (79 bytes in the standard game, see pack()) for keeping lots of them around.
+    """
+    __slots__ = ("piles", "face_down", "variant", "recycles")
+
+    def __init__(self, variant=DEFAULT_VARIANT):
+        self.variant = variant
+
+        # list of arrays for holding piles of cards, top of a pile is the end of its array
+        self.piles = [array("B") for _ in range(variant.pile_count)]
+
+        # Number of face down cards at the bottom of each play pile.
+        # The face down pile is face down by definition, everything else is face up.
+        self.face_down = [0] * variant.pile_count
+
+        # Times the face up pile has been turned back over. Only counted when the
+        # variant limits it, so unlimited games don't tell apart states that are the same.
+        self.recycles = 0
+
+    def copy(self):
+        """ Independent copy of this state """
+        state = GameState.__new__(GameState)
+        state.variant = self.variant
+        state.piles = [pile[:] for pile in self.piles]
+        state.face_down = self.face_down.copy()
+        state.recycles = self.recycles
+        return state
+
+    def is_face_up(self, pile_index, card_index):
+        """ Is the card at this spot in the pile face up? """
+        if pile_index == BOTTOM_FACE_DOWN_PILE:
+            return False
+        return card_index >= self.face_down[pile_index]
+
+    def is_won(self):
+        """ Are all the cards on the foundations? """
+        return all(len(self.piles[i]) == len(CARD_VALUES) for i in self.variant.foundations)
+
+    def pack(self):
+        """
+        Pack the state into bytes: the recycle count, for every pile its length
+        and face down count, then all the cards pile after pile. The variant isn't
+        in there, unpack() is told it.
+        """
+        header = bytearray([self.recycles])
+        for pile, face_down in zip(self.piles, self.face_down):
+            header.append(len(pile))
+            header.append(face_down)
+        return bytes(header) + b"".join(pile.tobytes() for pile in self.piles)
+
+    @classmethod
+    def unpack(cls, data, variant=DEFAULT_VARIANT):
+        """ Rebuild a state made by pack() """
+        state = cls(variant)
+        state.recycles = data[0]
+        offset = 1 + 2 * variant.pile_count
+        for i in range(variant.pile_count):
+            length = data[1 + 2 * i]
+            state.face_down[i] = data[2 + 2 * i]
+            state.piles[i].frombytes(data[offset:offset + length])
+            offset += length
+        return state
+
+
+def new_game(deck=None, variant=DEFAULT_VARIANT):
+    """
+    Deal a new game.
+
+    `deck` is the order of the cards in the face down pile before dealing, last
+    card on top (see deals.py), variant.deck_size of them. If it isn't given a
+    random deal is used.
+    """
+    if deck is None:
+        deck = deals.deal(deals.new_seed(), variant.deck_size)
+
+    state = GameState(variant)
+
+    # Put all the cards in the bottom face-down pile. With more than one deck
+    # the deal numbers every card apart, they're the same 52 cards again.
+    if variant.decks == 1:
+        state.piles[BOTTOM_FACE_DOWN_PILE] = array("B", deck)
+    else:
+        state.piles[BOTTOM_FACE_DOWN_PILE] = array("B", [card % DECK_SIZE for card in deck])
+
+    # Pull from that pile into the middle piles, dealing a pile at a time
+    for pile_no in variant.tableaus:
+        for _ in range(pile_no - PLAY_PILE_1 + 1):
+            state.piles[pile_no].append(state.piles[BOTTOM_FACE_DOWN_PILE].pop())
+
+        # Everything but the top card stays face down
+        state.face_down[pile_no] = len(state.piles[pile_no]) - 1
+
+    return state
+
+
+def draw_move(state):
+    """ The move for clicking the face down pile, or None if it is empty """
+    stock = state.piles[BOTTOM_FACE_DOWN_PILE]
+    if not stock:
+        return None
+    return Move(BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE, min(state.variant.draw_count, len(stock)))
+
+
+def recycle_move(state):
+    """ The move for turning the face up pile back over, or None if that isn't allowed """
+    if state.piles[BOTTOM_FACE_DOWN_PILE] or not state.piles[BOTTOM_FACE_UP_PILE]:
+        return None
+    limit = state.variant.recycle_limit
+    if limit is not None and state.recycles >= limit:
+        return None
+    return Move(BOTTOM_FACE_UP_PILE, BOTTOM_FACE_DOWN_PILE, len(state.piles[BOTTOM_FACE_UP_PILE]))
+
+
+def can_drop(state, card, pile_index, count=1):
+    """ Can `count` cards, starting with `card`, be dropped on this pile? """
+
+    # Dropping onto a tableau?
+    variant = state.variant
+    if PLAY_PILE_1 <= pile_index <= variant.last_tableau:
+        pile = state.piles[pile_index]
+
+        # Only a king can go on an empty tableau
+        if not pile:
+            return card >> SUIT_BITS == KING
+
+        # Enforce alternating colors and proper rank
+        top_card = pile[-1]
+        return (card ^ top_card) & RED_BIT != 0 and (card >> SUIT_BITS) + 1 == top_card >> SUIT_BITS
+
+    # Dropping onto a foundation? One card at a time, same suit, going up from the ace.
+    if variant.first_foundation <= pile_index < variant.pile_count:
+        if count != 1:
+            return False
+
+        pile = state.piles[pile_index]
+        if not pile:
+            return card >> SUIT_BITS == ACE
+
+        # Same suit and one rank up is exactly the card int one rank step up
+        return card == pile[-1] + (1 << SUIT_BITS)
+
+    # Not dropping onto a tableau nor a foundation
+    return False
+
+
+def is_legal(state, move):
+    """ Is this move allowed in this state? """
+    src, dst, count = move
+
+    if src == BOTTOM_FACE_DOWN_PILE:
+        return move == draw_move(state)
+    if dst == BOTTOM_FACE_DOWN_PILE:
+        return move == recycle_move(state)
+    if src == dst or count < 1:
+        return False
+
+    pile = state.piles[src]
+    variant = state.variant
+
+    # Only a face up run can be picked up off a tableau, everywhere else it's the top card
+    if PLAY_PILE_1 <= src <= variant.last_tableau:
+        if count > len(pile) - state.face_down[src]:
+            return False
+    elif src == BOTTOM_FACE_UP_PILE:
+        if count != 1 or not pile:
+            return False
+    else:
+        # Moving between foundations never gets anywhere
+        if count != 1 or not pile or dst >= variant.first_foundation:
+            return False
+
+    return can_drop(state, pile[-count], dst, count)
+
+
+def legal_moves(state):
+    """ Every move allowed in this state """
+    moves = []
+
+    move = draw_move(state) or recycle_move(state)
+    if move:
+        moves.append(move)
+
+    piles = state.piles
+    foundations = state.variant.foundations
+    tableaus = state.variant.tableaus
+
+    # Work out up front which piles each card could be dropped on, so every card
+    # only needs one lookup instead of a can_drop() per pile
+    tableau_targets = {}
+    empty_tableaus = []
+    for dst in tableaus:
+        pile = piles[dst]
+        if not pile:
+            empty_tableaus.append(dst)
+            continue
+        top_card = pile[-1]
+        if top_card >> SUIT_BITS != ACE:
+            # The two cards one rank down in the other colour
+            suit = (top_card & RED_BIT) ^ RED_BIT
+            lower = top_card - (1 << SUIT_BITS) & ~SUIT_MASK
+            tableau_targets.setdefault(lower | suit, []).append(dst)
+            tableau_targets.setdefault(lower | suit + 2, []).append(dst)
+
+    foundation_targets = {}
+    for dst in foundations:
+        pile = piles[dst]
+        if not pile:
+            for suit in range(len(CARD_SUITS)):
+                foundation_targets.setdefault(ACE << SUIT_BITS | suit, []).append(dst)
+        elif pile[-1] >> SUIT_BITS != KING:
+            foundation_targets.setdefault(pile[-1] + (1 << SUIT_BITS), []).append(dst)
+
+    def targets_for(card):
+        if card >> SUIT_BITS == KING:
+            return empty_tableaus
+        return tableau_targets.get(card, ())
+
+    # Single cards off the face up pile and the foundations
+    for src in [BOTTOM_FACE_UP_PILE, *foundations]:
+        if not piles[src]:
+            continue
+        card = piles[src][-1]
+        for dst in targets_for(card):
+            moves.append(Move(src, dst, 1))
+        if src == BOTTOM_FACE_UP_PILE:
+            for dst in foundation_targets.get(card, ()):
+                moves.append(Move(src, dst, 1))
+
+    # Any face up run off the tableaus
+    for src in tableaus:
+        pile = piles[src]
+        if not pile:
+            continue
+        for dst in foundation_targets.get(pile[-1], ()):
+            moves.append(Move(src, dst, 1))
+        for start in range(state.face_down[src], len(pile)):
+            count = len(pile) - start
+            for dst in targets_for(pile[start]):
+                if dst != src:
+                    moves.append(Move(src, dst, count))
+
+    return moves
+
+
+def foundation_counts(state):
+    """
+    How many cards of each suit are on the foundations, indexed by suit. Worked
+    out once per position, it makes each is_safe_to_foundation() check O(1).
+
+    With more than one deck it's the count on the lowest foundation of the suit,
+    as every copy of a card has to be up before the next rank is safe.
+    """
+    decks = state.variant.decks
+    if decks == 1:
+        counts = [0] * len(CARD_SUITS)
+        for pile_index in state.variant.foundations:
+            pile = state.piles[pile_index]
+            if pile:
+                counts[pile[0] & SUIT_MASK] = len(pile)
+        return counts
+
+    heights = [[] for _ in CARD_SUITS]
+    for pile_index in state.variant.foundations:
+        pile = state.piles[pile_index]
+        if pile:
+            heights[pile[0] & SUIT_MASK].append(len(pile))
+    return [min(suit_heights) if len(suit_heights) == decks else 0 for suit_heights in heights]
+
+
+def is_safe_to_foundation(card, counts):
+    """
+    Can this card go to a foundation without ever being missed on the tableaus?
+    Auto-play and the solver both go by this.
+
+    Aces and twos always can. Anything higher can once both opposite colour cards
+    one rank down are on the foundations, as they were the only cards that could
+    have been put on it.
+    """
+    rank = card >> SUIT_BITS
+    if rank <= 1:
+        return True
+    other_colour = (card & RED_BIT) ^ 1
+    return counts[other_colour] >= rank and counts[other_colour + 2] >= rank
+
+
+def safe_move(state):
+    """ A foundation move that can always be made without losing anything, or None """
+    piles = state.piles
+
+    # Foundation each card that could go straight up would go on: one rank up
+    # from a foundation's top card, or any ace on an empty one
+    targets = {}
+    for dst in state.variant.foundations:
+        pile = piles[dst]
+        if pile:
+            targets.setdefault(pile[-1] + (1 << SUIT_BITS), dst)
+        else:
+            for suit in range(len(CARD_SUITS)):
+                targets.setdefault(ACE << SUIT_BITS | suit, dst)
+
+    counts = None
+    for src in (BOTTOM_FACE_UP_PILE, *state.variant.tableaus):
+        pile = piles[src]
+        if not pile or pile[-1] not in targets:
+            continue
+        card = pile[-1]
+        if counts is None:
+            counts = foundation_counts(state)
+        if is_safe_to_foundation(card, counts):
+            return Move(src, targets[card], 1)
+    return None
+
+
+def apply(state, move):
+    """
+    Make a move, changing `state` in place. The move has to be legal.
+
+    Returns True if the move uncovered a face down card on a tableau, which is
+    flipped face up.
+    """
+    src, dst, count = move
+    src_pile = state.piles[src]
+    dst_pile = state.piles[dst]
+
+    # Flipping cards over between the bottom piles reverses their order
+    if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+        for _ in range(count):
+            dst_pile.append(src_pile.pop())
+        if dst == BOTTOM_FACE_DOWN_PILE and state.variant.recycle_limit is not None:
+            state.recycles += 1
+        return False
+
+    dst_pile.extend(src_pile[-count:])
+    del src_pile[-count:]
+
+    # Discover the top card of the tableau we just left
+    if src_pile and state.face_down[src] == len(src_pile):
+        state.face_down[src] -= 1
+        return True
+    return False
+
+
+def undo(state, move, flipped):
+    """
+    Take back a move made with apply(), changing `state` in place. `flipped` is
+    what apply() returned for it. Costs as much as the cards moved, nothing more.
+    """
+    src, dst, count = move
+    src_pile = state.piles[src]
+    dst_pile = state.piles[dst]
+
+    if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+        for _ in range(count):
+            src_pile.append(dst_pile.pop())
+        if dst == BOTTOM_FACE_DOWN_PILE and state.variant.recycle_limit is not None:
+            state.recycles -= 1
+        return
+
+    # Turn the card we discovered back over first
+    if flipped:
+        state.face_down[src] += 1
+
+    src_pile.extend(dst_pile[-count:])
+    del dst_pile[-count:]
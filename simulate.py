@@ -0,0 +1,191 @@
+"""
+Batch simulator: plays lots of seeded deals through the headless rules and
+writes one result per deal, for win-rate statistics.
+
+    python simulate.py --games 100000 --strategy greedy --out results.csv
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import deals
+import rules
+import solver
+
+# Random and greedy players give up after this many moves
+MAX_MOVES = 1000
+
+# How many deals each worker task plays, and how many tasks are queued per worker
+CHUNK_SIZE = 64
+TASKS_PER_WORKER = 4
+
+RESULT_FIELDS = ["seed", "won", "moves", "time"]
+
+
+def play_random(state, rng):
+    """
+    Make random legal moves until the game is won, stuck, or too long. Returns
+    the move count and whether the game was won.
+    """
+    moves = 0
+    while moves < MAX_MOVES and not state.is_won():
+        legal = rules.legal_moves(state)
+        if not legal:
+            break
+        rules.apply(state, rng.choice(legal))
+        moves += 1
+    return moves, state.is_won()
+
+
+def play_greedy(state, rng):
+    """
+    Always make the best looking move by the solver's move ordering, never going
+    back to a state already seen. Returns the move count and whether the game was won.
+    """
+    seen = {state.pack()}
+    moves = 0
+    while moves < MAX_MOVES and not state.is_won():
+        for move in solver.ordered_moves(state):
+            flipped = rules.apply(state, move)
+            key = state.pack()
+            if key not in seen:
+                seen.add(key)
+                break
+            rules.undo(state, move, flipped)
+        else:
+            break
+        moves += 1
+    return moves, state.is_won()
+
+
+def play_solver(state, rng):
+    """
+    Let the solver find a winning line. Returns the number of moves in it and
+    whether the deal was won: None when the solver gave up before it could tell.
+    """
+    result = solver.solve(state)
+    if result.won:
+        for move in result.moves:
+            rules.apply(state, move)
+    return len(result.moves), result.won
+
+
+STRATEGIES = {
+    "random": play_random,
+    "greedy": play_greedy,
+    "solver": play_solver,
+}
+
+
+def play_seeds(strategy, seeds, variant=rules.DEFAULT_VARIANT):
+    """ Play every seed with a strategy, in a worker process """
+    play = STRATEGIES[strategy]
+    results = []
+    for seed in seeds:
+        start = time.perf_counter()
+        state = rules.new_game(deals.deal(seed, variant.deck_size), variant)
+        moves, won = play(state, random.Random(seed))
+        results.append({
+            "seed": seed,
+            "won": won,
+            "moves": moves,
+            "time": round(time.perf_counter() - start, 6),
+        })
+    return results
+
+
+class ResultWriter:
+    """ Streams results to a CSV or JSON lines file as they come in """
+
+    def __init__(self, file, file_format):
+        self.file = file
+        self.file_format = file_format
+        if file_format == "csv":
+            self.writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, results):
+        if self.file_format == "csv":
+            self.writer.writerows(results)
+        else:
+            for result in results:
+                self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+
+def simulate(strategy, games, first_seed=0, workers=None, on_results=None, variant=rules.DEFAULT_VARIANT):
+    """
+    Play `games` deals of a variant, seeds first_seed onwards, spread over worker processes.
+    `on_results` is called with each finished chunk of results, in whatever
+    order they finish. Returns (games played, games won).
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = iter(range(first_seed, first_seed + games))
+    played = won = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+
+        def submit_next():
+            chunk = [seed for _, seed in zip(range(CHUNK_SIZE), seeds)]
+            if chunk:
+                pending.add(executor.submit(play_seeds, strategy, chunk, variant))
+
+        # Only keep a few tasks per worker queued, so a million deals don't all sit in memory
+        for _ in range(workers * TASKS_PER_WORKER):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                results = future.result()
+                played += len(results)
+                won += sum(result["won"] is True for result in results)
+                if on_results:
+                    on_results(results)
+                submit_next()
+
+    return played, won
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Play lots of seeded solitaire deals and record the results.")
+    parser.add_argument("--games", type=int, default=1000, help="how many deals to play")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first deal")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="greedy")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--out", default="-", help="results file, .csv or .jsonl (default: stdout)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="results format (default: from the file extension, else csv)")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    file_format = args.format or ("jsonl" if args.out.endswith((".jsonl", ".json")) else "csv")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+
+    start = time.perf_counter()
+    try:
+        writer = ResultWriter(out, file_format)
+        played, won = simulate(args.strategy, args.games, args.first_seed, args.workers, writer.write, variant)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.strategy}: won {won} of {played} ({won / max(played, 1):.2%}) "
+          f"in {elapsed:.1f}s ({played / elapsed:.0f} games/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
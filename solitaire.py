@@ -1,79 +1,34 @@
 """
 Solitaire clone.
 """
+import argparse
+import time
+
 import arcade
-import random
-from os import path
-
-# Screen title and size
-SCREEN_WIDTH = 1067
-SCREEN_HEIGHT = 800
-SCREEN_TITLE = "Slithery Solitaire"
-
-# Constants for sizing
-CARD_SCALE = 0.6
-
-# How big are the cards?
-CARD_WIDTH = 140 * CARD_SCALE
-CARD_HEIGHT = 190 * CARD_SCALE
-
-# How big is the mat we'll place the card on?
-MAT_PERCENT_OVERSIZE = 1.25
-MAT_HEIGHT = int(CARD_HEIGHT * MAT_PERCENT_OVERSIZE)
-MAT_WIDTH = int(CARD_WIDTH * MAT_PERCENT_OVERSIZE)
-
-# How much space do we leave as a gap between the mats?
-# Done as a percent of the mat size.
-VERTICAL_MARGIN_PERCENT = 0.10
-HORIZONTAL_MARGIN_PERCENT = 0.10
-
-# The Y of the bottom row (2 piles)
-BOTTOM_Y = MAT_HEIGHT / 2 + MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
-
-# The X of where to start putting things on the left side
-START_X = MAT_WIDTH / 2 + MAT_WIDTH * HORIZONTAL_MARGIN_PERCENT
-
-# Card constants
-CARD_VALUES = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
-CLUBS = "Clubs"
-HEARTS = "Hearts"
-SPADES = "Spades"
-DIAMONDS = "Diamonds"
-CARD_SUITS = [CLUBS, HEARTS, SPADES, DIAMONDS]
-BLACK_SUITS = [CLUBS, SPADES]
-RED_SUITS = [HEARTS, DIAMONDS]
-
-"""Constants for card mats -- using calculations instead of hard values so it can scale and be changed easily."""
-# The Y of the top row (4 piles)
-TOP_Y = SCREEN_HEIGHT - MAT_HEIGHT / 2 - MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
-
-# The Y of the middle row (7 piles)
-MIDDLE_Y = TOP_Y - MAT_HEIGHT - MAT_HEIGHT * VERTICAL_MARGIN_PERCENT
-
-# How far apart each pile goes
-X_SPACING = MAT_WIDTH + MAT_WIDTH * HORIZONTAL_MARGIN_PERCENT
-
-# where them piles are @
-PILE_COUNT = 13
-BOTTOM_FACE_DOWN_PILE = 0
-BOTTOM_FACE_UP_PILE = 1
-PLAY_PILE_1 = 2
-PLAY_PILE_2 = 3
-PLAY_PILE_3 = 4
-PLAY_PILE_4 = 5
-PLAY_PILE_5 = 6
-PLAY_PILE_6 = 7
-PLAY_PILE_7 = 8
-TOP_PILE_1 = 9
-TOP_PILE_2 = 10
-TOP_PILE_3 = 11
-TOP_PILE_4 = 12
-
-# fanned card spacing
-CARD_VERTICAL_OFFSET = CARD_HEIGHT * CARD_SCALE * 0.3
-
-# back of card sprite
-FACE_DOWN_IMAGE = ":resources:images/cards/cardBack_red2.png"
+
+import autoplay
+import deals
+import layout
+import rules
+from assets import ASSETS
+from history import MoveLog
+from hud import Hud
+from layout import CARD_SCALE, MAT_HEIGHT, MAT_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE
+from rules import BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE, DEFAULT_VARIANT
+from sound import SoundPool
+from textures import CARD_TEXTURES, card_image_file
+
+# Thickness of the outlines drawn around a hint
+HINT_BORDER_WIDTH = 3
+
+# Seconds between the moves the game makes by itself, so they can be followed
+AUTO_MOVE_STAGGER = 0.08
+
+
+def fair_best_move(state):
+    """ montecarlo.best_move(), for the fair hint worker. Imported there, it brings in the batch engine. """
+    from montecarlo import best_move
+    return best_move(state)
 
 
 class Card(arcade.Sprite):
@@ -87,18 +42,21 @@ class Card(arcade.Sprite):
         self.value = value
 
         # Image to use for the sprite when face up
-        self.image_file_name = f":resources:images/cards/card{self.suit}{self.value}.png"
+        self.image_file_name = card_image_file(self.suit, self.value)
         self.is_face_up = False
-        super().__init__(FACE_DOWN_IMAGE, scale, hit_box_algorithm="None")
+
+        # Textures come preloaded from CARD_TEXTURES, flipping never touches the disk
+        self.face_texture = CARD_TEXTURES.face(suit, value)
+        super().__init__(scale=scale, texture=CARD_TEXTURES.back, hit_box_algorithm="None")
 
     def face_down(self):
         """ Turn card face-down """
-        self.texture = arcade.load_texture(FACE_DOWN_IMAGE)
+        self.texture = CARD_TEXTURES.back
         self.is_face_up = False
 
     def face_up(self):
         """ Turn card face-up """
-        self.texture = arcade.load_texture(self.image_file_name)
+        self.texture = self.face_texture
         self.is_face_up = True
 
     @property
@@ -110,11 +68,29 @@ class Card(arcade.Sprite):
 class SolitaireGame(arcade.Window):
     """ Main application class. """
 
-    def __init__(self):
-        super().__init__(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
+    def __init__(self, replay_writer=None, deal_database=None, variant=DEFAULT_VARIANT):
+        super().__init__(layout.screen_width(variant), SCREEN_HEIGHT, SCREEN_TITLE)
 
-        # Sprite list with all the cards, no matter what pile they are in.
-        self.card_list = None
+        # Rules to play by: draw count, passes, decks and tableaus (see rules.Variant)
+        self.variant = variant
+
+        # Where every game gets recorded, if anywhere (see replay.py)
+        self.replay_writer = replay_writer
+
+        # Winnable deals to pick new games from, if any (see dealdb.py)
+        self.deal_database = deal_database
+
+        # One sprite list per pile to draw its cards from, bottom card first, plus one
+        # drawn over all of them for the cards being dragged. Lifting or dropping a
+        # stack only touches the short lists involved, never every card in the game.
+        self.pile_sprite_lists = None
+        self.held_sprite_list = None
+
+        # The cards as plain numbers, with the rules of the game (see rules.py)
+        self.state = None
+
+        # Seed the current deal was made from
+        self.seed = None
 
         arcade.set_background_color(arcade.color.AMAZON)
 
@@ -131,11 +107,68 @@ class SolitaireGame(arcade.Window):
         # list of lists for holding piles of cards
         self.piles = None
 
+        # Where every card is: card -> (pile index, index in that pile).
+        # Kept up to date on every append and pop so lookups never scan the piles.
+        self.card_locations = None
+
         # Score tally
         self.score = 0
 
-    def setup(self):
-        """ Set up the game here. Call this function to restart the game. """
+        # Moves made, for undo and redo, and when the current game started
+        self.history = None
+        self.start_time = 0.0
+
+        # Scoreboard, built once and only updated when a value changes
+        self.hud = Hud()
+
+        # Slides the cards into place instead of moving them in one jump
+        self.animator = None
+
+        # Send cards that are safe on the foundations up by themselves (A)
+        self.auto_play = False
+
+        # Flip sound, played once a frame when there were moves in it. M mutes it,
+        # + and - change the volume.
+        self.flip_sound = SoundPool()
+        self.flip_sound_due = False
+
+        # The optional parts below are only imported and made the first time
+        # they're used, so they don't slow down startup.
+
+        # Times the event handlers while it's turned on (F3)
+        self.profiler = None
+
+        # Solver looking for hints in the background (H). It only starts once the
+        # player first asks for one, then keeps up with every move after that.
+        self.hints = None
+
+        # Move being shown as a hint, and whether we're still waiting for one
+        self.hint_move = None
+        self.hint_pending = False
+
+        # Fair hint being worked out on a worker thread (Shift+H), and the worker
+        self.fair_hint = None
+        self.fair_hint_worker = None
+
+        # Waiting on the hint engine for the rest of an auto-complete that got stuck
+        self.auto_complete_pending = False
+
+        # Card textures get loaded on a worker (see assets.py). Until they are in
+        # the window shows the empty mats, then deals this seed.
+        self.assets_ready = False
+        self.loading_seed = None
+        self.loading_text = arcade.Text("Loading...", self.width / 2, SCREEN_HEIGHT / 2, arcade.color.WHITE, 30,
+                                        anchor_x="center")
+
+        # Set by --startup-benchmark, see report_startup()
+        self.startup_benchmark = False
+        self.first_frame_reported = False
+
+    def setup(self, seed=None):
+        """
+        Set up the game here. Call this function to restart the game.
+        Pass a seed to replay a particular deal, otherwise a new one is picked.
+        """
         # List of cards we are dragging with the mouse
         self.held_cards = []
 
@@ -148,323 +181,240 @@ class SolitaireGame(arcade.Window):
         # Sprite list with all the mats tha cards lay on.
         self.pile_mat_list: arcade.SpriteList = arcade.SpriteList()
 
-        # Create the mats for the bottom face down and face up piles
-        pile = arcade.SpriteSolidColor(MAT_WIDTH, MAT_HEIGHT, arcade.color.DARK_MOSS_GREEN)
-        pile.position = START_X, BOTTOM_Y
-        self.pile_mat_list.append(pile)
-
-        pile = arcade.SpriteSolidColor(MAT_WIDTH, MAT_HEIGHT, arcade.color.DARK_MOSS_GREEN)
-        pile.position = START_X + X_SPACING, BOTTOM_Y
-        self.pile_mat_list.append(pile)
-
-        # Create the seven middle piles
-        for i in range(7):
+        # One mat per pile, in pile order: the bottom face down and face up piles,
+        # the middle piles, then the top "play" piles
+        for position in layout.pile_positions(self.variant):
             pile = arcade.SpriteSolidColor(MAT_WIDTH, MAT_HEIGHT, arcade.color.DARK_MOSS_GREEN)
-            pile.position = START_X + i * X_SPACING, MIDDLE_Y
+            pile.position = position
             self.pile_mat_list.append(pile)
 
-        # Create the top "play" piles
-        for i in range(4):
-            pile = arcade.SpriteSolidColor(MAT_WIDTH, MAT_HEIGHT, arcade.color.DARK_MOSS_GREEN)
-            pile.position = START_X + i * X_SPACING, TOP_Y
-            self.pile_mat_list.append(pile)
-
-        # Sprite list with all the cards, no matter what pile they are in.
-        self.card_list = arcade.SpriteList()
-
-        # Create every card
-        for card_suit in CARD_SUITS:
+        # Sprite lists the cards are drawn from
+        self.pile_sprite_lists = [arcade.SpriteList() for _ in range(self.variant.pile_count)]
+        self.held_sprite_list = arcade.SpriteList()
 
-            for card_value in CARD_VALUES:
-                card = Card(card_suit, card_value, CARD_SCALE)
-
-                card.position = START_X, BOTTOM_Y
-
-                self.card_list.append(card)
+        # The cards can't be made without their textures. on_update() calls this again once they're loaded.
+        if not self.assets_ready:
+            ASSETS.start()
+            self.state = None
+            self.loading_seed = seed
+            return
 
-        # Shuffle the cards
-        for pos1 in range(len(self.card_list)):
-            pos2 = random.randrange(len(self.card_list))
-            self.card_list.swap(pos1, pos2)
+        # Deal the game we are going to play
+        if seed is None and self.deal_database:
+            seed, length = self.deal_database.random_winnable()
+            print(f"Winnable in {length} moves")
+        self.seed = deals.new_seed() if seed is None else seed
+        self.state = rules.new_game(deals.deal(self.seed, self.variant.deck_size), self.variant)
+        print("Deal", self.seed)
+        self.history = MoveLog()
+        self.start_time = time.monotonic()
+        if self.replay_writer:
+            self.replay_writer.start_game(self.seed, self.variant)
+        self.hint_move = None
+        self.hint_pending = False
+        self.fair_hint = None
+        self.auto_complete_pending = False
+        if self.hints:
+            self.hints.new_game()
+            self.hints.update(self.state)
 
         # Create a list of lists, each holds a pile of cards.
-        self.piles = [[] for _ in range(PILE_COUNT)]
-
-        # Put all the cards in the bottom face-down pile
-        for card in self.card_list:
-            self.piles[BOTTOM_FACE_DOWN_PILE].append(card)
-
-        # - Pull from that pile into the middle piles, all face-down
-        # doing a loop for each pile
-        for pile_no in range(PLAY_PILE_1, PLAY_PILE_7 + 1):
-            # Deal proper number of cards for that pile
-            for j in range(pile_no - PLAY_PILE_1 + 1):
-                # Pop the card off the deck we are dealing from
-                card = self.piles[BOTTOM_FACE_DOWN_PILE].pop()
-                # Put in the proper pile
-                self.piles[pile_no].append(card)
-                # Move card to same position as pile we just put it in
-                card.position = self.pile_mat_list[pile_no].position
-                # Put on top in draw order
-                self.pull_to_top(card)
-
-        # Flip up the top cards
-        for i in range(PLAY_PILE_1, PLAY_PILE_7 + 1):
-            self.piles[i][-1].face_up()
+        self.piles = [[] for _ in range(self.variant.pile_count)]
+        self.card_locations = {}
+
+        # Lay out the sprites the same way the game state was dealt. Every card
+        # starts on the face down pile, and the ones dealt out fly to their piles
+        # in the order they were dealt.
+        if self.animator is None:
+            # Only imported now, numpy would slow down opening the window
+            from animation import Animator
+            self.animator = Animator()
+        self.animator.clear()
+        for pile_no, pile in enumerate(self.state.piles):
+            for card_index, card_no in enumerate(pile):
+                # One sprite per card dealt, two decks have two of each
+                card = Card(rules.card_suit(card_no), rules.card_value(card_no), CARD_SCALE)
+                card.position = self.pile_mat_list[BOTTOM_FACE_DOWN_PILE].position
+                if self.state.is_face_up(pile_no, card_index):
+                    card.face_up()
+                self.place_card(card, pile_no)
+        dealt = [(pile_no, card_index) for pile_no in self.variant.tableaus
+                 for card_index in range(len(self.piles[pile_no]))]
+        self.animator.queue([self.piles[pile_no][card_index] for pile_no, card_index in dealt],
+                            [layout.card_position(self.state, pile_no, card_index) for pile_no, card_index in dealt])
 
     def on_draw(self):
         """ Render the screen. """
         # Clear the screen
         self.clear()
 
+        # Still waiting for the textures: just the mats
+        if self.state is None:
+            self.pile_mat_list.draw()
+            self.loading_text.draw()
+            if self.startup_benchmark:
+                self.report_startup()
+            return
+
         # Draw Scoreboard
-        arcade.draw_text('Score: ' + str(self.score), 750, 50,
-                         arcade.color.WHITE, 30, 5000, 'left')
+        self.hud.update(self.score, time.monotonic() - self.start_time, len(self.history),
+                        len(self.state.piles[BOTTOM_FACE_DOWN_PILE]))
+        self.hud.draw()
 
         # Draw Mats
 
         self.pile_mat_list.draw()
 
-        # Draw the cards
-        self.card_list.draw()
+        # Draw the cards, pile by pile, then whatever we are dragging on top
+        for sprite_list in self.pile_sprite_lists:
+            sprite_list.draw()
+        self.held_sprite_list.draw()
+
+        if self.hint_move:
+            self.draw_hint()
+
+        # Frame time graph, when profiling is on
+        if self.profiler:
+            self.profiler.draw()
+
+        if self.startup_benchmark:
+            self.report_startup()
+
+    def on_update(self, delta_time):
+        """
+        Move the cards along, deal once the textures are loaded, and pick up a hint
+        the background search has just found
+        """
+        if self.animator:
+            self.animator.update(delta_time)
+
+        if not self.assets_ready and ASSETS.ready:
+            ASSETS.finish(self.ctx.default_atlas)
+            self.assets_ready = True
+            self.flip_sound.set_sound(ASSETS.flip_sound)
+            print(f"Loaded card textures and sound in {ASSETS.load_time * 1000:.0f} ms")
+            self.setup(self.loading_seed)
+
+        if self.hint_pending:
+            if self.fair_hint:
+                self.pick_up_fair_hint()
+            else:
+                self.show_hint()
+
+        if self.auto_complete_pending:
+            self.finish_auto_complete()
+
+        if self.flip_sound_due:
+            self.flip_sound.play()
+            self.flip_sound_due = False
+
+    def report_startup(self):
+        """
+        For startup.py: print when the first frame is drawn and when the first
+        frame with cards in it is, then quit.
+        """
+        self.ctx.finish()
+        if not self.first_frame_reported:
+            self.first_frame_reported = True
+            print("startup: first frame", flush=True)
+        if self.state is not None:
+            print("startup: interactive", flush=True)
+            self.startup_benchmark = False
+            self.close()
 
     def on_mouse_press(self, x, y, button, key_modifiers):
         """ Called when the user presses a mouse button. """
 
         # If button == 1, then the left-click was clicked. 
         # Any other click (i.e. right-click) should be ignored. Pressing multiple different kinds of clicks can lead to glitches otherwise.
-        if button != 1:
+        if button != 1 or self.state is None:
             return
 
-        # Better code for running the sound effect. Place this code somewhere else though; it's unnecessary here.
-        # flipSound = path.dirname(path.abspath(__file__)) + "/flipSound.mp3"
-        # arcade.load_sound(flipSound).play()
-
-        # Get list of cards we've clicked on
-        cards = arcade.get_sprites_at_point((x, y), self.card_list)
+        # What did we click on? Worked out from the layout and the piles, no sprite checks needed.
+        hit = layout.card_at_point(self.state, x, y)
+        if hit is None:
+            return
+        pile_index, card_index = hit
 
         # Have we clicked on a card?
-        if len(cards) > 0:
-
-            # Might be a stack of cards, get the top one
-            primary_card = cards[-1]
-            assert isinstance(primary_card, Card)
+        if card_index is not None:
 
-            # Figure out what pile the card is in
+            # The top card at that point
+            primary_card = self.piles[pile_index][card_index]
 
-            pile_index = self.get_pile_for_card(primary_card)
-
-            # Are we clicking on the bottom deck, to flip three cards?
+            # Are we clicking on the bottom deck, to flip cards over?
 
             if pile_index == BOTTOM_FACE_DOWN_PILE:
-
-                # Flip three cards
-                for i in range(3):
-
-                    # If we ran out of cards, stop
-                    if len(self.piles[BOTTOM_FACE_DOWN_PILE]) == 0:
-                        break
-
-                    # Get top card
-                    card = self.piles[BOTTOM_FACE_DOWN_PILE][-1]
-
-                    # Flip face up
-                    card.face_up()
-
-                    # Move card position to bottom-right face up pile
-                    card.position = self.pile_mat_list[BOTTOM_FACE_UP_PILE].position
-
-                    # Remove card from face down pile
-                    self.piles[BOTTOM_FACE_DOWN_PILE].remove(card)
-
-                    # Move card to face up list
-                    self.piles[BOTTOM_FACE_UP_PILE].append(card)
-
-                    # Put on top draw-order wise
-                    self.pull_to_top(card)
+                self.play_move(rules.draw_move(self.state))
 
             elif primary_card.is_face_down:
-                # Is the card face down? In one of those middle 7 piles? Then flip up
-                primary_card.face_up()
+                # Is the card face down? In one of those middle piles? It gets flipped
+                # when the last card on top of it leaves, so there is nothing to grab.
+                pass
             else:
+                # Land anything still sliding in, so the cards are picked up from where they belong
+                self.animator.finish(self.piles[pile_index][card_index:])
+
                 # All other cases, grab the face-up card we are clicking on
                 self.held_cards = [primary_card]
                 # Save the position
                 self.held_cards_original_position = [self.held_cards[0].position]
-                # Put on top in drawing order
-                self.pull_to_top(self.held_cards[0])
 
                 # Is this a stack of cards? If so, grab the other cards too
-                card_index = self.piles[pile_index].index(primary_card)
                 for i in range(card_index + 1, len(self.piles[pile_index])):
                     card = self.piles[pile_index][i]
                     self.held_cards.append(card)
                     self.held_cards_original_position.append(card.position)
-                    self.pull_to_top(card)
-
-        else:
-            # Click on a mat instead of a card?
-            mats = arcade.get_sprites_at_point((x, y), self.pile_mat_list)
-
-            if len(mats) > 0:
-                mat = mats[0]
-                mat_index = self.pile_mat_list.index(mat)
 
-                # Is it our turned over flip mat? and no cards on it?
-                if mat_index == BOTTOM_FACE_DOWN_PILE and len(self.piles[BOTTOM_FACE_DOWN_PILE]) == 0:
+                # Put on top in drawing order
+                self.lift_cards(self.held_cards)
 
-                    # Flip the deck back over so we can restart
-                    temp_list = self.piles[BOTTOM_FACE_UP_PILE].copy()
+        # Click on a mat instead of a card? Is it our turned over flip mat? and no cards on it?
+        elif pile_index == BOTTOM_FACE_DOWN_PILE:
 
-                    for card in reversed(temp_list):
-                        card.face_down()
-                        self.piles[BOTTOM_FACE_UP_PILE].remove(card)
-                        self.piles[BOTTOM_FACE_DOWN_PILE].append(card)
-                        card.position = self.pile_mat_list[BOTTOM_FACE_DOWN_PILE].position
+            # Flip the deck back over so we can restart
+            move = rules.recycle_move(self.state)
+            if move:
+                self.play_move(move)
 
     def on_mouse_release(self, x: float, y: float, button: int,
                          modifiers: int):
-
-
-        # Commenting this out cause why have the sound play on mouse_press AND on mouse_release?
-        # arcade.load_sound(r"C:\Users\mattw\Downloads\Deepwoken Talent Card Flip Sound Effect.mp3").play()
-
-
         """ Called when the user presses a mouse button. """
         # If we don't have any cards, who cares
         if len(self.held_cards) == 0:
             return
 
+        # Back to drawing the held cards with their pile, wherever that ends up being
+        self.drop_held_cards()
+
         # find the closest pile incase we are in contact with more than one
-        pile, distance = arcade.get_closest_sprite(self.held_cards[0], self.pile_mat_list)
-        reset_position = False  # Default was True. Changed it to False.
-        
+        pile_index = layout.drop_pile(*self.held_cards[0].position, self.variant)
+
         # Pile we just came from.
         originalPile = self.get_pile_for_card(self.held_cards[0])
 
-
         # see if we are actually in contact with the closest pile
-        if arcade.check_for_collision(self.held_cards[0], pile):
-
-            # What pile is it?
-            pile_index = self.pile_mat_list.index(pile)
-
-            primaryHeldCard = self.held_cards[0]
-
-            # Dropped onto pile we just came from?
-            if pile_index == originalPile:
-                    reset_position = True
-
-            # Dropping onto a tableau?
-            elif PLAY_PILE_1 <= pile_index <= PLAY_PILE_7:
-                # Is droppedOntoPile empty and primaryHeldCard not a King?
-                if not self.piles[pile_index] and primaryHeldCard.value != "K":
-                    reset_position = True
+        if pile_index is not None:
 
-                # Is droppedOntoPile not empty? Then set droppedOntoCard
-                elif self.piles[pile_index]:
-                    droppedOntoCard = self.piles[pile_index][-1]
+            # Ask the rules if the held cards can go there
+            move = rules.Move(originalPile, pile_index, len(self.held_cards))
+            reset_position = not rules.is_legal(self.state, move)
 
-                    # Enforce alternating colors
-                    if (primaryHeldCard.suit in BLACK_SUITS and droppedOntoCard.suit in BLACK_SUITS) or (
-                            primaryHeldCard.suit in RED_SUITS and droppedOntoCard.suit in RED_SUITS):
-                        reset_position = True
-
-                    # Enforce proper rank of King
-                    # If card is King and pile is a tableau, then it's an error cause the pile isn't empty~
-                    elif primaryHeldCard.suit == "K" and PLAY_PILE_1 <= pile_index <= TOP_PILE_4:
-                        reset_position = True
-                    # Enforce proper rank of cards (except King)
-                    elif CARD_VALUES[CARD_VALUES.index(primaryHeldCard.value) + 1] != droppedOntoCard.value:
-                        reset_position = True
-
-            # Dropping onto a foundation?
-            elif TOP_PILE_1 <= pile_index <= TOP_PILE_4:
-
-                # Is pile empty?
-                if not self.piles[pile_index]:
-                    # Considering the pile is indeed empty, is primaryHeldCard not an Ace?
-                    if primaryHeldCard.value != "A":
-                        reset_position = True
-
-                else:
-                    droppedOntoCard = self.piles[pile_index][-1]
-
-                    # Considering pile isn't empty, is primaryHeldCard not the same suit as the droppedOntoCard?
-                    if droppedOntoCard.suit != primaryHeldCard.suit:
-                        reset_position = True
-
-                    # Considering pile isn't empty, is primaryHeldCard an Ace? (Illegal move).
-                    elif primaryHeldCard.suit == "A":
-                        reset_position = True 
-
-                    # Considering pile isn't empty and isn't an Ace, is primaryHeldCard not one value higher than droppedOntoCard?
-                    elif CARD_VALUES[CARD_VALUES.index(primaryHeldCard.value) -1] != droppedOntoCard.value:
-                        reset_position = True
-
-                    # Considering pile isn't empty, is length of held cards not just 1 card?
-                    elif len(self.held_cards) != 1:
-                        reset_position = True
-
-                
-            # Not dropping onto a tableau nor a foundation? (So, onto some random spot or other illegal deck). Reset.
-            else:
-                reset_position = True
-
-
-            # if none of the flags from earlier set reset_position to True, proceed with attempting to move each card.
-            # Note: reset_position can stil be set to True from within this block.
             if not reset_position:
-                # Is it on a middle play pile?
-                if PLAY_PILE_1 <= pile_index <= PLAY_PILE_7:
-                    # Are there already cards there?
-                    if len(self.piles[pile_index]) > 0:
-                        # Move cards to proper position
-                        top_card = self.piles[pile_index][-1]
-                        for i, dropped_card in enumerate(self.held_cards):
-                            dropped_card.position = top_card.center_x, \
-                                top_card.center_y - CARD_VERTICAL_OFFSET * (i + 1)
-                    else:
-                        # Are there no cards in the middle play pile?
-                        for i, dropped_card in enumerate(self.held_cards):
-                            # Move cards to proper position
-                            dropped_card.position = pile.center_x, \
-                                pile.center_y - CARD_VERTICAL_OFFSET * i
-
-                    for card in self.held_cards:
-                        # Cards are in the right position, but we need to move them to the right list
-                        self.move_card_to_new_pile(card, pile_index)
-
-                # Release on top play pile? And only one card held?
-                elif TOP_PILE_1 <= pile_index <= TOP_PILE_4 and len(self.held_cards) == 1:
-                    # Move position of card to pile
-                    self.held_cards[0].position = pile.position
-                    # Move card to card list
-                    for card in self.held_cards:
-                        self.move_card_to_new_pile(card, pile_index)
+                # Move the cards to the right list, and into position on top of what's there already
+                self.play_move(move)
 
+        # Didn't land on any pile at all? Then they go back.
+        else:
+            reset_position = True
 
         # The resetting of cards to previous valid state
         if reset_position:
             print("RESET THE CARDS")
-            # Where-ever we were dropped, it wasn't valid. Reset the each card's position
+            # Where-ever we were dropped, it wasn't valid. Slide each card back
             # to its original spot.
             for pile_index, card in enumerate(self.held_cards):
-                card.position = self.held_cards_original_position[pile_index]
-
-            # We are no longer holding cards
-            self.held_cards = []
-
-            # For each held card, move it to the pile we dropped on
-            for i, dropped_card in enumerate(self.held_cards):
-                # Move cards to proper position
-                dropped_card.position = pile.center_x, pile.center_y
-
-        # if we didn't end up resetting, pile we left is a tableau, and pile we left isn't empty, discover the top card of the pile we just left~
-        else:
-            if (PLAY_PILE_1 <= originalPile <= PLAY_PILE_7) and self.piles[originalPile]:
-                self.piles[originalPile][-1].face_up()
-
+                self.animator.move(card, self.held_cards_original_position[pile_index])
 
         # We are no longer holding cards
         self.held_cards = []
@@ -477,43 +427,319 @@ class SolitaireGame(arcade.Window):
             card.center_x += dx
             card.center_y += dy
 
-    def pull_to_top(self, card: arcade.Sprite):
-        """ Pull card to top of rendering order (last to render, looks on-top) """
+    def lift_cards(self, cards):
+        """ Draw these cards, the top of their pile, over everything else while they are dragged """
+        for card in cards:
+            self.pile_sprite_lists[self.card_locations[card][0]].remove(card)
+            self.held_sprite_list.append(card)
 
-        # Remove, and append to the end
-        self.card_list.remove(card)
-        self.card_list.append(card)
+    def drop_held_cards(self):
+        """ Put the held cards back to drawing with the pile they are in """
+        for card in self.held_cards:
+            self.held_sprite_list.remove(card)
+            self.pile_sprite_lists[self.card_locations[card][0]].append(card)
 
     def get_pile_for_card(self, card):
         """ What pile is this card in? """
-        for index, pile in enumerate(self.piles):
-            if card in pile:
-                return index
+        return self.card_locations[card][0]
+
+    def place_card(self, card, pile_index):
+        """ Put a card on top of a pile """
+        pile = self.piles[pile_index]
+        self.card_locations[card] = pile_index, len(pile)
+        pile.append(card)
+        self.pile_sprite_lists[pile_index].append(card)
 
     def remove_card_from_pile(self, card):
         """ Remove card from whatever pile it was in. """
-        for pile in self.piles:
-            if card in pile:
-                pile.remove(card)
-                break
+        pile_index, card_index = self.card_locations.pop(card)
+        pile = self.piles[pile_index]
+        del pile[card_index]
+        self.pile_sprite_lists[pile_index].remove(card)
+
+        # Anything that was on top of it moves down a spot. Nothing, when it was the top card.
+        for i in range(card_index, len(pile)):
+            self.card_locations[pile[i]] = pile_index, i
 
     def move_card_to_new_pile(self, card, pile_index):
         """ Move the card to a new pile """
         self.remove_card_from_pile(card)
-        self.piles[pile_index].append(card)
+        self.place_card(card, pile_index)
+
+    def move_cards_to_new_pile(self, cards, pile_index):
+        """ Move a run of cards, which are the top of the pile they are in, to a new pile """
+        src_index, card_index = self.card_locations[cards[0]]
+        del self.piles[src_index][card_index:]
+        for card in cards:
+            self.pile_sprite_lists[src_index].remove(card)
+            self.place_card(card, pile_index)
+
+    def play_move(self, move):
+        """ Make a move for the player, then whatever moves the game makes for them after it """
+        self.apply_move(move)
+        self.play_automatic_moves()
+
+    def play_automatic_moves(self):
+        """
+        Finish the game once every card is face up, or else send the safe cards up
+        to the foundations if auto-play is on. The moves go out one after another.
+        """
+        if autoplay.can_auto_complete(self.state):
+            moves = autoplay.auto_complete_moves(self.state)
+            if moves is None:
+                # Stuck the simple way: search for the rest on the hint thread, never here
+                self.hint_engine().update(self.state)
+                self.auto_complete_pending = True
+                return
+        elif self.auto_play:
+            moves = autoplay.safe_moves(self.state)
+        else:
+            return
+        for i, move in enumerate(moves):
+            self.apply_move(move, i * AUTO_MOVE_STAGGER)
+
+    def finish_auto_complete(self):
+        """ Play out the win the hint engine found for a stuck auto-complete, once it has """
+        moves = self.hints.winning_line(self.state)
+        if moves is None:
+            return
+        # No win found is remembered by the engine, so this position isn't searched again
+        self.auto_complete_pending = False
+        for i, move in enumerate(moves):
+            self.apply_move(move, i * AUTO_MOVE_STAGGER)
+
+    def apply_move(self, move, delay=0.0):
+        """ Make a move in the game state, then bring the sprites along with it after `delay` seconds """
+        flipped = self.history.apply(self.state, move)
+        if self.replay_writer:
+            self.replay_writer.move(move)
+        self.show_move(move, flipped, delay)
+        self.moved()
+
+    def show_move(self, move, flipped, delay=0.0):
+        """ Bring the sprites along with a move already made in the game state """
+        src, dst, count = move
+
+        # Flipping cards over between the bottom piles takes them one at a time off the top
+        if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+            for _ in range(count):
+                card = self.piles[src][-1]
+                if dst == BOTTOM_FACE_UP_PILE:
+                    card.face_up()
+                else:
+                    card.face_down()
+                self.move_card_to_new_pile(card, dst)
+        else:
+            # Everything else moves the top `count` cards as they are
+            self.move_cards_to_new_pile(self.piles[src][-count:], dst)
+
+            # Discover the top card of the tableau we just left
+            if flipped:
+                self.piles[src][-1].face_up()
+
+        self.position_top_cards(dst, count, delay)
+
+    def undo_move(self):
+        """ Take back the last move """
+        delta = self.history.undo(self.state)
+        if delta is None:
+            return
+        if self.replay_writer:
+            self.replay_writer.undo()
+        (src, dst, count), flipped = delta
+
+        if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+            for _ in range(count):
+                card = self.piles[dst][-1]
+                if src == BOTTOM_FACE_UP_PILE:
+                    card.face_up()
+                else:
+                    card.face_down()
+                self.move_card_to_new_pile(card, src)
+        else:
+            # Turn the card we discovered back over, then put the cards back on it
+            if flipped:
+                self.piles[src][-1].face_down()
+            self.move_cards_to_new_pile(self.piles[dst][-count:], src)
+
+        self.position_top_cards(src, count)
+        self.moved()
+
+    def redo_move(self):
+        """ Make the last undone move again """
+        delta = self.history.redo(self.state)
+        if delta is not None:
+            if self.replay_writer:
+                self.replay_writer.move(delta[0])
+            self.show_move(*delta)
+            self.moved()
+
+    def moved(self):
+        """ The position changed: play the flip, and the old hint is stale, start on the next one """
+        self.flip_sound_due = True
+        self.hint_move = None
+        self.hint_pending = False
+        # A fair hint still being worked out is for the old position, its result is dropped
+        self.fair_hint = None
+        self.auto_complete_pending = False
+        if self.hints:
+            self.hints.update(self.state)
+
+    def show_hint(self):
+        """ Highlight the hinted move, or wait for the background search to find one """
+        move, _ = self.hint_engine().hint(self.state)
+        self.hint_move = move
+        self.hint_pending = move is None
+        if move is None:
+            self.hints.update(self.state)
+
+    def hint_engine(self):
+        """ The background solver, started the first time it's needed """
+        if self.hints is None:
+            from hint import HintEngine
+            self.hints = HintEngine()
+        return self.hints
+
+    def show_fair_hint(self):
+        """
+        Start working out the move most likely to win, by Monte Carlo playouts with
+        the face down cards guessed (see montecarlo.py). That takes about a fifth of
+        a second, so it runs on a worker thread and on_update() picks it up.
+        """
+        if self.fair_hint_worker is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.fair_hint_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fair-hint")
+        self.fair_hint = self.fair_hint_worker.submit(fair_best_move, self.state.copy())
+        self.hint_move = None
+        self.hint_pending = True
+
+    def pick_up_fair_hint(self):
+        """ Highlight the fair hint once the worker has it """
+        if not self.fair_hint.done():
+            return
+        value = self.fair_hint.result()
+        self.fair_hint = None
+        self.hint_pending = False
+        self.hint_move = value and value.move
+        if value:
+            print(f"Fair hint: {value.win_probability:.0%} to win, from {value.playouts} playouts a move")
+
+    def draw_hint(self):
+        """ Outline the cards the hint moves and where they go """
+        src, dst, count = self.hint_move
+
+        # Only the top card of the face down pile gets clicked to draw
+        if src == BOTTOM_FACE_DOWN_PILE:
+            count = 1
+        cards = self.piles[src][-count:] or [self.pile_mat_list[src]]
+        target = self.piles[dst][-1] if self.piles[dst] else self.pile_mat_list[dst]
+
+        for sprites, color in [(cards, arcade.color.YELLOW), ([target], arcade.color.LIGHT_GREEN)]:
+            left = min(sprite.left for sprite in sprites)
+            right = max(sprite.right for sprite in sprites)
+            bottom = min(sprite.bottom for sprite in sprites)
+            top = max(sprite.top for sprite in sprites)
+            arcade.draw_lrtb_rectangle_outline(left, right, top, bottom, color, HINT_BORDER_WIDTH)
+
+    def position_top_cards(self, pile_index, count, delay=0.0):
+        """ Slide the top `count` sprites of a pile to where the layout says they go """
+        pile = self.piles[pile_index]
+        for card_index in range(len(pile) - count, len(pile)):
+            self.animator.move(pile[card_index], layout.card_position(self.state, pile_index, card_index),
+                               delay=delay)
 
     def on_key_press(self, symbol: int, modifiers: int):
         """ User presses key """
+        # Nothing to play with until the cards are dealt
+        if self.state is None:
+            return
+
         # Pressing R Will reset the game
         if symbol == arcade.key.R:
             # Restart
             self.setup()
+        # H highlights a good next move, Shift+H one found without looking at the face down cards
+        elif symbol == arcade.key.H and not self.held_cards:
+            if modifiers & arcade.key.MOD_SHIFT:
+                self.show_fair_hint()
+            else:
+                self.show_hint()
+        # Ctrl+Z takes back a move, Ctrl+Y or Ctrl+Shift+Z puts it back
+        elif symbol == arcade.key.Z and modifiers & arcade.key.MOD_CTRL and not self.held_cards:
+            if modifiers & arcade.key.MOD_SHIFT:
+                self.redo_move()
+            else:
+                self.undo_move()
+        elif symbol == arcade.key.Y and modifiers & arcade.key.MOD_CTRL and not self.held_cards:
+            self.redo_move()
+        # A turns auto-play of safe cards on and off
+        elif symbol == arcade.key.A:
+            self.auto_play = not self.auto_play
+            print("Auto-play on" if self.auto_play else "Auto-play off")
+            if self.auto_play and not self.held_cards:
+                self.play_automatic_moves()
+        # M mutes the sound, + and - turn it up and down
+        elif symbol == arcade.key.M:
+            self.flip_sound.toggle_mute()
+            print("Sound off" if self.flip_sound.muted else "Sound on")
+        elif symbol in (arcade.key.PLUS, arcade.key.EQUAL, arcade.key.NUM_ADD):
+            self.flip_sound.change_volume(1)
+            print(f"Volume {self.flip_sound.volume:.0%}")
+        elif symbol in (arcade.key.MINUS, arcade.key.NUM_SUBTRACT):
+            self.flip_sound.change_volume(-1)
+            print(f"Volume {self.flip_sound.volume:.0%}")
+        # F3 turns the profiling overlay on and off
+        elif symbol == arcade.key.F3:
+            if self.profiler is None:
+                from profiler import Profiler
+                self.profiler = Profiler(self)
+            self.profiler.toggle()
+
+    def on_close(self):
+        """ Window is closing, save whatever the profiler recorded """
+        file_name = self.profiler and self.profiler.dump()
+        if file_name:
+            print("Wrote profile to", file_name)
+        if self.replay_writer:
+            self.replay_writer.close()
+        super().on_close()
 
 
 def main():
     """ Main function """
-    window = SolitaireGame()
-    window.setup()
+    parser = argparse.ArgumentParser(description=SCREEN_TITLE)
+    parser.add_argument("--seed", type=int, default=None, help="deal to play (default: a random one)")
+    parser.add_argument("--record", metavar="FILE", default=None, help="append every game played to a replay file")
+    parser.add_argument("--winnable", metavar="DBFILE", default=None,
+                        help="only deal games the solver won, from a database built by dealdb.py")
+    parser.add_argument("--startup-benchmark", action="store_true",
+                        help="report when the first frames are drawn and quit (see startup.py)")
+    rules.add_variant_arguments(parser)
+    args = parser.parse_args()
+    try:
+        variant = rules.variant_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+    # Replays store seeds unsigned, and new games only ever get seeds from 0 up
+    if args.seed is not None and args.seed < 0:
+        parser.error("--seed can't be negative")
+
+    # Get the files loading while the window is being made
+    ASSETS.start()
+
+    replay_writer = deal_database = None
+    if args.record:
+        from replay import ReplayWriter
+        replay_writer = ReplayWriter(args.record, buffered=False)
+    if args.winnable:
+        from dealdb import DealDatabase
+        deal_database = DealDatabase(args.winnable)
+        if deal_database.variant != variant:
+            parser.error(f"{args.winnable} holds deals for {deal_database.variant}, not {variant}")
+
+    window = SolitaireGame(replay_writer, deal_database, variant)
+    window.startup_benchmark = args.startup_benchmark
+    window.setup(args.seed)
     arcade.run()
 
 
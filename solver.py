@@ -0,0 +1,416 @@
+"""
+Depth-first Klondike solver on top of the headless rules.
+
+Decides whether a deal can be won and finds the moves that win it, so deals can
+be screened before they are handed to players.
+"""
+import random
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import rules
+from rules import BOTTOM_FACE_DOWN_PILE, BOTTOM_FACE_UP_PILE, DECK_SIZE, PLAY_PILE_1, safe_move
+
+
+class ZobristKeys(NamedTuple):
+    """
+    Zobrist keys for a variant: one random 64 bit number per (pile, position in
+    pile, card), one per (pile, number of face down cards) and, when the variant
+    limits recycling, one per recycle count. A state hashes to the xor of the
+    keys of everything in it.
+    """
+    cards: list
+    face_down: list
+    recycles: list
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(variant):
+    """ Keys for hashing states of a variant. The seed is fixed so hashes are stable between runs. """
+    rng = random.Random(0x5011)
+    # Longest a pile can get is the face down pile holding every card dealt
+    positions = variant.deck_size
+    cards = [[[rng.getrandbits(64) for _ in range(DECK_SIZE)] for _ in range(positions)]
+             for _ in range(variant.pile_count)]
+    face_down = [[rng.getrandbits(64) for _ in range(positions)] for _ in range(variant.pile_count)]
+    limit = variant.recycle_limit
+    recycles = [] if limit is None else [rng.getrandbits(64) for _ in range(limit + 1)]
+    return ZobristKeys(cards, face_down, recycles)
+
+
+# How many states the transposition table remembers, and how many positions a
+# single solve will look at before giving up
+DEFAULT_TABLE_SIZE = 1_000_000
+DEFAULT_MAX_NODES = 500_000
+
+# How often, in nodes, a search checks whether it has been cancelled
+CANCEL_CHECK_NODES = 256
+
+
+def zobrist_hash(state):
+    """ Zobrist hash of a whole state """
+    keys = zobrist_keys(state.variant)
+    h = keys.recycles[state.recycles] if keys.recycles else 0
+    for pile_index, pile in enumerate(state.piles):
+        pile_keys = keys.cards[pile_index]
+        for position, card in enumerate(pile):
+            h ^= pile_keys[position][card]
+        h ^= keys.face_down[pile_index][state.face_down[pile_index]]
+    return h
+
+
+def hash_move(state, key, move, keys=None):
+    """
+    Apply `move` to `state` and return the hash of the new state, updating `key`
+    (the hash before the move) instead of rehashing all 52 cards. Also returns
+    whether the move turned a card face up, as rules.apply() does.
+
+    `keys` saves looking up zobrist_keys() for the state's variant on every move.
+    """
+    if keys is None:
+        keys = zobrist_keys(state.variant)
+    src, dst, count = move
+    src_pile = state.piles[src]
+    src_keys = keys.cards[src]
+    dst_keys = keys.cards[dst]
+    src_start = len(src_pile) - count
+    dst_start = len(state.piles[dst])
+
+    # Flipping cards over between the bottom piles reverses their order
+    if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+        for i in range(count):
+            card = src_pile[-1 - i]
+            key ^= src_keys[src_start + count - 1 - i][card] ^ dst_keys[dst_start + i][card]
+        if dst == BOTTOM_FACE_DOWN_PILE and keys.recycles:
+            key ^= keys.recycles[state.recycles] ^ keys.recycles[state.recycles + 1]
+    else:
+        for i in range(count):
+            card = src_pile[src_start + i]
+            key ^= src_keys[src_start + i][card] ^ dst_keys[dst_start + i][card]
+
+    face_down = state.face_down[src]
+    flipped = rules.apply(state, move)
+    if flipped:
+        key ^= keys.face_down[src][face_down] ^ keys.face_down[src][face_down - 1]
+    return key, flipped
+
+
+# Canonical keys add their piles' hashes up, modulo 2**64
+KEY_MASK = (1 << 64) - 1
+
+
+@lru_cache(maxsize=None)
+def canonical_keys(variant):
+    """
+    zobrist_keys() with every tableau given the first tableau's keys and every
+    foundation the first foundation's, so that a pile hashes the same whichever
+    tableau or foundation it is.
+    """
+    keys = zobrist_keys(variant)
+    cards = list(keys.cards)
+    face_down = list(keys.face_down)
+    for first, piles in ((PLAY_PILE_1, variant.tableaus), (variant.first_foundation, variant.foundations)):
+        for pile_index in piles:
+            cards[pile_index] = keys.cards[first]
+            face_down[pile_index] = keys.face_down[first]
+    return ZobristKeys(cards, face_down, keys.recycles)
+
+
+def canonical_pile_hashes(state, keys=None):
+    """ Hash of every pile of a state, for canonical_hash() """
+    if keys is None:
+        keys = canonical_keys(state.variant)
+    hashes = []
+    for pile_index, pile in enumerate(state.piles):
+        pile_keys = keys.cards[pile_index]
+        h = keys.face_down[pile_index][state.face_down[pile_index]]
+        for position, card in enumerate(pile):
+            h ^= pile_keys[position][card]
+        hashes.append(h)
+    return hashes
+
+
+def canonical_hash(state, hashes=None):
+    """
+    Hash of a state that doesn't change when tableaus, or foundations, swap
+    places: it is the same for positions that are really the same game. Piles
+    are hashed alone and added up rather than xored together, so two equal
+    piles, like two empty tableaus, don't cancel out. The stock and the waste
+    keep their own keys, their order together with the size of the waste
+    saying where in the deck the player is.
+    """
+    keys = canonical_keys(state.variant)
+    if hashes is None:
+        hashes = canonical_pile_hashes(state, keys)
+    key = keys.recycles[state.recycles] if keys.recycles else 0
+    return (sum(hashes) + key) & KEY_MASK
+
+
+def canonical_move(state, key, hashes, move, keys):
+    """
+    Apply `move` to `state`, updating `key`, its canonical_hash(), and `hashes`,
+    its canonical_pile_hashes(), for just the two piles that changed. Returns
+    the new key, whether a card was turned face up, and the two piles' old
+    hashes for canonical_undo().
+    """
+    src, dst, count = move
+    old_src = hashes[src]
+    old_dst = hashes[dst]
+    new_src = old_src
+    new_dst = old_dst
+    src_pile = state.piles[src]
+    src_keys = keys.cards[src]
+    dst_keys = keys.cards[dst]
+    src_start = len(src_pile) - count
+    dst_start = len(state.piles[dst])
+
+    # As in hash_move(), but the two piles' hashes are kept apart
+    if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+        for i in range(count):
+            card = src_pile[-1 - i]
+            new_src ^= src_keys[src_start + count - 1 - i][card]
+            new_dst ^= dst_keys[dst_start + i][card]
+        if dst == BOTTOM_FACE_DOWN_PILE and keys.recycles:
+            key += keys.recycles[state.recycles + 1] - keys.recycles[state.recycles]
+    else:
+        for i in range(count):
+            card = src_pile[src_start + i]
+            new_src ^= src_keys[src_start + i][card]
+            new_dst ^= dst_keys[dst_start + i][card]
+
+    face_down = state.face_down[src]
+    flipped = rules.apply(state, move)
+    if flipped:
+        new_src ^= keys.face_down[src][face_down] ^ keys.face_down[src][face_down - 1]
+    hashes[src] = new_src
+    hashes[dst] = new_dst
+    return (key + new_src - old_src + new_dst - old_dst) & KEY_MASK, flipped, (old_src, old_dst)
+
+
+def canonical_undo(state, hashes, move, flipped, old):
+    """ Take back a canonical_move() """
+    rules.undo(state, move, flipped)
+    hashes[move[0]], hashes[move[1]] = old
+
+
+class TranspositionTable:
+    """
+    Bounded set of state hashes already searched. When it is full the least
+    recently used entry is thrown out to make room.
+    """
+
+    def __init__(self, size=DEFAULT_TABLE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        """ Remember a state hash, evicting the oldest one if the table is full """
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        """ Forget a state hash, if it is there """
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class SolveResult(NamedTuple):
+    """
+    Outcome of a solve. `won` is None if the search ran out of nodes before it
+    could decide either way; `moves` is the winning line when `won` is True.
+
+    The solver skips moves that split a face up run without freeing a card for
+    the foundations, so False means no win exists among the moves it tries.
+    """
+    won: Optional[bool]
+    moves: list
+    nodes: int
+
+
+def _move_priority(state, move):
+    """ Sort key for trying moves, most promising first """
+    src, dst, count = move
+    if dst >= state.variant.first_foundation:
+        return 0
+    if PLAY_PILE_1 <= src <= state.variant.last_tableau:
+        # Moves that turn over a face down card come next
+        left = len(state.piles[src]) - count
+        if left and left == state.face_down[src]:
+            return 1
+        if not left:
+            return 3
+        return 4
+    if src == BOTTOM_FACE_UP_PILE:
+        return 2
+    if src == BOTTOM_FACE_DOWN_PILE or dst == BOTTOM_FACE_DOWN_PILE:
+        return 5
+    # Pulling cards back off the foundations is the last resort
+    return 6
+
+
+def _exposes_foundation_card(state, src, count):
+    """ Would taking `count` cards off pile `src` leave a card that can go straight to a foundation? """
+    card = state.piles[src][-count - 1]
+    return any(rules.can_drop(state, card, dst) for dst in state.variant.foundations)
+
+
+def ordered_moves(state):
+    """
+    Moves worth searching from this state, best first. A safe foundation move is
+    the only child when there is one.
+    """
+    move = safe_move(state)
+    if move:
+        return [move]
+
+    moves = []
+    last_tableau = state.variant.last_tableau
+    for move in rules.legal_moves(state):
+        src, dst, count = move
+        # Moving a whole pile to an empty tableau gets nowhere
+        if PLAY_PILE_1 <= src <= last_tableau and PLAY_PILE_1 <= dst <= last_tableau \
+                and count == len(state.piles[src]) and not state.piles[dst]:
+            continue
+        # Splitting a face up run is only worth it to get at the card under it
+        if PLAY_PILE_1 <= src <= last_tableau and PLAY_PILE_1 <= dst <= last_tableau \
+                and len(state.piles[src]) - count > state.face_down[src] and not _exposes_foundation_card(state, src, count):
+            continue
+        moves.append(move)
+    moves.sort(key=lambda m: _move_priority(state, m))
+    return moves
+
+
+class Solver:
+    """
+    Depth-first search over the Klondike game tree. The transposition table is
+    kept between solves so it can be reused on positions from the same game.
+    It is keyed by canonical_hash(), so a position reached again with its
+    tableaus or foundations in other places is skipped too.
+
+    When a solve ends, the table only holds states whose every line was searched
+    without finding a win: the states still on the search path (the winning line,
+    or wherever the search stopped) are taken back out. So a later solve from any
+    position can skip everything in it.
+
+    `shared` is an optional second table, shared with other solvers (see
+    parallel_solver.py). States go into it once every line from them has been
+    searched, and states in it are skipped like those in the solver's own table.
+    """
+
+    def __init__(self, table_size=DEFAULT_TABLE_SIZE, max_nodes=DEFAULT_MAX_NODES, shared=None):
+        self.table = TranspositionTable(table_size)
+        self.max_nodes = max_nodes
+        self.shared = shared
+
+    def solve(self, state, cancel=None, splitter=None):
+        """
+        Search for a win from `state`, which is left untouched. `cancel` is an
+        optional threading.Event; setting it from another thread stops the search
+        as if it had run out of nodes.
+
+        `splitter` lets other searches take work off this one (see
+        parallel_solver.py). Every CANCEL_CHECK_NODES nodes, if splitter.wanted(),
+        the untried moves nearest the root are handed to splitter.give() as lines
+        of moves from `state`, and not searched here. A solver that gave work away
+        has only searched part of the tree, so False then means no win in that part.
+        """
+        nodes = 0
+        state = state.copy()
+        if state.is_won():
+            return SolveResult(True, [], nodes)
+
+        keys = canonical_keys(state.variant)
+        hashes = canonical_pile_hashes(state, keys)
+        key = canonical_hash(state, hashes)
+        self.table.add(key)
+
+        # The search walks a single state forwards and backwards. `path` holds the
+        # (move, flipped, old pile hashes) deltas from the root to it, so backing
+        # up is canonical_undo().
+        path = []
+
+        # Each entry is a state's hash and the moves still to try from it
+        stack = [(key, iter(ordered_moves(state)))]
+
+        # Stack entries below this gave moves away, so aren't searched through
+        # when they come off the stack and mustn't go in the shared table
+        given_away = 0
+        while stack:
+            key, moves = stack[-1]
+            move = next(moves, None)
+            if move is None:
+                stack.pop()
+                if self.shared is not None and len(stack) >= given_away:
+                    self.shared.add(key)
+                given_away = min(given_away, len(stack))
+                if path:
+                    canonical_undo(state, hashes, *path.pop())
+                continue
+
+            child_key, flipped, old = canonical_move(state, key, hashes, move, keys)
+            nodes += 1
+
+            if state.is_won():
+                self._forget_path(stack)
+                return SolveResult(True, [delta[0] for delta in path] + [move], nodes)
+
+            if nodes % CANCEL_CHECK_NODES == 0:
+                if cancel and cancel.is_set():
+                    self._forget_path(stack)
+                    return SolveResult(None, [], nodes)
+                if splitter is not None and splitter.wanted():
+                    depth = self._give_away(stack, path, splitter)
+                    if depth is not None:
+                        given_away = max(given_away, depth + 1)
+
+            if child_key in self.table or (self.shared is not None and child_key in self.shared):
+                canonical_undo(state, hashes, move, flipped, old)
+                continue
+
+            if nodes >= self.max_nodes:
+                self._forget_path(stack)
+                return SolveResult(None, [], nodes)
+            self.table.add(child_key)
+
+            path.append((move, flipped, old))
+            stack.append((child_key, iter(ordered_moves(state))))
+
+        return SolveResult(False, [], nodes)
+
+    def _give_away(self, stack, path, splitter):
+        """
+        Hand the untried moves of the stack entry nearest the root that has any to
+        splitter.give(), as lines from the root. Returns the entry's depth, or None
+        if there was nothing left to give.
+        """
+        for depth, (_, moves) in enumerate(stack):
+            rest = list(moves)
+            if rest:
+                line = [delta[0] for delta in path[:depth]]
+                splitter.give([line + [move] for move in rest])
+                return depth
+        return None
+
+    def _forget_path(self, stack):
+        """ Take the states on the search path out of the table, they weren't searched through """
+        for key, _ in stack:
+            self.table.discard(key)
+
+
+def solve(state, table_size=DEFAULT_TABLE_SIZE, max_nodes=DEFAULT_MAX_NODES):
+    """ Solve a single position with a fresh solver """
+    return Solver(table_size, max_nodes).solve(state)
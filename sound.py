@@ -0,0 +1,66 @@
+"""
+Card flip sound.
+
+The MP3 is decoded once, by the asset loader (see assets.py). Each flip then
+goes to one of a few players kept for the whole game: quick flips overlap
+instead of cutting each other off, and nothing gets decoded or set up on a click.
+"""
+import pyglet
+
+# How many flips can sound at once. A flip past that restarts the oldest one.
+POOL_SIZE = 4
+
+DEFAULT_VOLUME = 0.5
+VOLUME_STEP = 0.1
+
+
+class SoundPool:
+    """ Plays one decoded sound through a small pool of players """
+
+    def __init__(self, size=POOL_SIZE, volume=DEFAULT_VOLUME):
+        self.size = size
+        self.volume = volume
+        self.muted = False
+
+        # The decoded sound, None until set_sound() or if it couldn't be loaded
+        self.source = None
+        self.players = []
+
+        # Player to use next when they're all busy, the one started longest ago
+        self.oldest = 0
+
+    def set_sound(self, sound):
+        """ Use an arcade.Sound (already decoded, not streaming), or None for silence """
+        self.source = sound.source if sound else None
+        self.players = [pyglet.media.Player() for _ in range(self.size)] if sound else []
+        self.oldest = 0
+
+    def play(self):
+        """ Play the sound from the start on a free player """
+        if self.muted or self.source is None:
+            return
+
+        player = next((player for player in self.players if not player.playing), None)
+        if player is None:
+            player = self.players[self.oldest]
+            self.oldest = (self.oldest + 1) % self.size
+
+        player.volume = self.volume
+        if player.source is None:
+            # Played to the end before, which empties the player
+            player.queue(self.source)
+        else:
+            player.pause()
+            player.seek(0.0)
+        player.play()
+
+    def toggle_mute(self):
+        self.muted = not self.muted
+        if self.muted:
+            for player in self.players:
+                player.pause()
+
+    def change_volume(self, steps):
+        """ Turn the volume up (or down, for negative steps) by VOLUME_STEP per step """
+        self.volume = min(1.0, max(0.0, round(self.volume + steps * VOLUME_STEP, 2)))
+        self.muted = False
@@ -0,0 +1,62 @@
+"""
+Startup benchmark: time from launching the game to its first frame, and to the
+first frame with the cards dealt and ready to play.
+
+Each run starts a fresh interpreter, so imports and file loading are counted
+the way a player (or a kiosk) sees them:
+
+    python startup.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from os import path
+
+GAME_FILE = path.join(path.dirname(path.abspath(__file__)), "solitaire.py")
+
+# Lines solitaire.py prints with --startup-benchmark, and what they mark
+EVENTS = {"startup: first frame": "first_frame", "startup: interactive": "interactive"}
+
+
+def launch(seed=1):
+    """ Start the game once, returns seconds from launch to each event """
+    start = time.perf_counter()
+    times = {}
+    game = subprocess.Popen([sys.executable, GAME_FILE, "--seed", str(seed), "--startup-benchmark"],
+                            stdout=subprocess.PIPE, text=True)
+    for line in game.stdout:
+        event = EVENTS.get(line.strip())
+        if event:
+            times[event] = time.perf_counter() - start
+    game.wait()
+    if game.returncode or len(times) != len(EVENTS):
+        raise RuntimeError(f"Game exited with {game.returncode} before reporting {sorted(EVENTS.values())}")
+    return times
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Time solitaire from launch to first interactive frame.")
+    parser.add_argument("--runs", type=int, default=5, help="how many times to launch the game")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    runs = [launch() for _ in range(args.runs)]
+    summary = {}
+    for event in EVENTS.values():
+        times = [run[event] * 1000 for run in runs]
+        summary[event] = {"median_ms": statistics.median(times), "min_ms": min(times), "max_ms": max(times)}
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for event, stats in summary.items():
+            print(f"{event:12}  median {stats['median_ms']:7.1f} ms  "
+                  f"min {stats['min_ms']:7.1f} ms  max {stats['max_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Checks of the headless modules against the rules, to re-run whenever rules.py
+changes: the batch engine has to agree with rules.legal_moves() and
+rules.apply() on every position, and a replay has to read back the game that
+was written. Runs under pytest, or on its own:
+
+    python test_headless.py
+"""
+import os
+import random
+import tempfile
+
+import numpy as np
+
+import dealdb
+import deals
+import layout
+import replay
+import rules
+import solver
+from batch import BatchGames
+
+# The variants checked, between them covering every setting
+VARIANTS = [rules.VARIANTS[name] for name in ("klondike", "draw-one", "vegas", "double")] + \
+           [rules.Variant(draw_count=2, recycle_limit=0, columns=5)]
+
+SEEDS = range(20)
+PLAYOUT_MOVES = 150
+
+
+def _random_games(variant):
+    """
+    For each seed, (seed, steps, final state) of a random game, the steps being
+    (state, move made from it) pairs
+    """
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        state = rules.new_game(deals.deal(seed, variant.deck_size), variant)
+        steps = []
+        for _ in range(PLAYOUT_MOVES):
+            moves = rules.legal_moves(state)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            steps.append((state.copy(), move))
+            rules.apply(state, move)
+        yield seed, steps, state
+
+
+def test_batch_matches_rules():
+    for variant in VARIANTS:
+        for seed, steps, _ in _random_games(variant):
+            for state, move in steps:
+                games = BatchGames.from_states([state])
+                mask, counts, _ = games.legal()
+                batch_moves = {games.move(0, action, counts) for action in mask[0].nonzero()[0]}
+                assert batch_moves == set(rules.legal_moves(state)), (variant, seed, state.pack())
+
+                action = games.actions.number(move)
+                games.apply(np.array([action]), counts[:, action], np.ones(1, dtype=bool))
+                rules.apply(state, move)
+                assert games.state(0).pack() == state.pack(), (variant, seed, move)
+
+
+def test_incremental_hashes():
+    """ hash_move() and canonical_move() keep up with hashing the whole state over """
+    for variant in VARIANTS:
+        keys = solver.zobrist_keys(variant)
+        canonical = solver.canonical_keys(variant)
+        for seed, steps, _ in _random_games(variant):
+            state = rules.new_game(deals.deal(seed, variant.deck_size), variant)
+            key = solver.zobrist_hash(state)
+            hashes = solver.canonical_pile_hashes(state)
+            canonical_key = solver.canonical_hash(state)
+            for _, move in steps:
+                other = state.copy()
+                key, flipped = solver.hash_move(other, key, move, keys)
+                before = state.pack()
+                canonical_key, flipped, old = solver.canonical_move(state, canonical_key, hashes, move, canonical)
+                assert key == solver.zobrist_hash(state), (variant, seed, move)
+                assert canonical_key == solver.canonical_hash(state), (variant, seed, move)
+                assert hashes == solver.canonical_pile_hashes(state), (variant, seed, move)
+
+                # Taken back, everything is as it was
+                undone_hashes = list(hashes)
+                solver.canonical_undo(state, undone_hashes, move, flipped, old)
+                assert state.pack() == before
+                assert solver.canonical_hash(state, undone_hashes) == solver.canonical_hash(state)
+                rules.apply(state, move)
+
+            # Swapping two tableaus round leaves the canonical hash alone
+            first, second = variant.tableaus[0], variant.tableaus[1]
+            swapped = state.copy()
+            swapped.piles[first], swapped.piles[second] = swapped.piles[second], swapped.piles[first]
+            swapped.face_down[first], swapped.face_down[second] = swapped.face_down[second], swapped.face_down[first]
+            assert solver.canonical_hash(swapped) == solver.canonical_hash(state), (variant, seed)
+
+
+def test_solver_lines_win():
+    """ A winning line from the solver is legal all the way through, and wins """
+    wins = 0
+    for variant in VARIANTS:
+        for seed in range(10):
+            state = rules.new_game(deals.deal(seed, variant.deck_size), variant)
+            result = solver.solve(state, max_nodes=5000)
+            if not result.won:
+                assert result.moves == []
+                continue
+            wins += 1
+            for move in result.moves:
+                assert move in rules.legal_moves(state), (variant, seed, move)
+                rules.apply(state, move)
+            assert state.is_won(), (variant, seed)
+    # The easy deals at least have to come out
+    assert wins >= 10, wins
+
+
+def _under_point(state, x, y):
+    """ card_at_point() the slow way, looking at every card and mat on the screen """
+    hits = []
+    for pile_index, pile in enumerate(state.piles):
+        hit = None
+        mat_x, mat_y = layout.pile_position(pile_index, state.variant)
+        if abs(x - mat_x) <= layout.MAT_WIDTH / 2 and abs(y - mat_y) <= layout.MAT_HEIGHT / 2:
+            hit = pile_index, None
+        for card_index in range(len(pile)):
+            card_x, card_y = layout.card_position(state, pile_index, card_index)
+            if abs(x - card_x) <= layout.CARD_WIDTH / 2 and abs(y - card_y) <= layout.CARD_HEIGHT / 2:
+                hit = pile_index, card_index
+        if hit:
+            hits.append(hit)
+    return hits
+
+
+def test_layout_hit_testing():
+    for variant in VARIANTS:
+        width = layout.screen_width(variant)
+        for seed, _, state in _random_games(variant):
+            rng = random.Random(seed)
+            points = [(rng.uniform(0, width), rng.uniform(0, layout.SCREEN_HEIGHT)) for _ in range(100)]
+            # And the visible strip of every card in the tableaus
+            for pile_index in variant.tableaus:
+                for card_index in range(len(state.piles[pile_index])):
+                    x, y = layout.card_position(state, pile_index, card_index)
+                    points.append((x + rng.uniform(-30, 30), y + layout.CARD_HEIGHT / 2 - rng.uniform(1, 10)))
+
+            for x, y in points:
+                hits = _under_point(state, x, y)
+                # Where a long tableau reaches over another pile, either could be meant
+                if len(hits) < 2:
+                    assert layout.card_at_point(state, x, y) == (hits[0] if hits else None), (variant, seed, x, y)
+
+                pile_index = layout.drop_pile(x, y, variant)
+                if pile_index is not None:
+                    mat_x, mat_y = layout.pile_position(pile_index, variant)
+                    assert abs(x - mat_x) < (layout.CARD_WIDTH + layout.MAT_WIDTH) / 2, (variant, x, y)
+                    assert abs(y - mat_y) < (layout.CARD_HEIGHT + layout.MAT_HEIGHT) / 2, (variant, x, y)
+
+        # A card dropped roughly on a mat goes on that pile, and off the mats on none
+        rng = random.Random(0)
+        for pile_index in range(variant.pile_count):
+            x, y = layout.pile_position(pile_index, variant)
+            assert layout.drop_pile(x + rng.uniform(-20, 20), y + rng.uniform(-20, 20), variant) == pile_index
+        assert layout.drop_pile(width + layout.MAT_WIDTH * 2, layout.SCREEN_HEIGHT / 2, variant) is None
+        assert layout.drop_pile(width / 2, layout.SCREEN_HEIGHT + layout.MAT_HEIGHT * 2, variant) is None
+
+
+def test_replay_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.rpl")
+        writer = replay.ReplayWriter(path)
+        expected = []
+        for variant in VARIANTS:
+            for seed, steps, state in _random_games(variant):
+                rng = random.Random(seed)
+                writer.start_game(seed, variant)
+                moves = []
+                for _, move in steps:
+                    writer.move(move)
+                    moves.append(move)
+                    # Now and then take a move back and make it again
+                    if rng.random() < 0.1:
+                        writer.undo()
+                        writer.move(move)
+                expected.append((seed, state, moves))
+        writer.close()
+
+        games = list(replay.replay(path))
+        assert len(games) == len(expected)
+        for game, (seed, state, moves) in zip(games, expected):
+            assert game.valid and game.seed == seed
+            assert game.state.variant == state.variant
+            assert game.state.pack() == state.pack()
+            assert game.moves == moves
+
+
+def test_replay_cut_off_or_corrupt():
+    """ Files cut off anywhere, or with a byte corrupted, read back without raising """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.rpl")
+        writer = replay.ReplayWriter(path)
+        for variant in VARIANTS:
+            for seed, steps, _ in _random_games(variant):
+                writer.start_game(seed, variant)
+                for _, move in steps[:30]:
+                    writer.move(move)
+        writer.close()
+        with open(path, "rb") as file:
+            data = file.read()
+
+        damaged = os.path.join(directory, "damaged.rpl")
+        rng = random.Random(0)
+        for length in rng.sample(range(len(replay.MAGIC), len(data)), 300):
+            corrupt = bytearray(data)
+            corrupt[rng.randrange(len(replay.MAGIC), len(data))] = rng.randrange(256)
+            for contents in (data[:length], corrupt):
+                with open(damaged, "wb") as file:
+                    file.write(contents)
+                list(replay.replay(damaged))
+
+        # A negative seed is refused up front, rather than half writing a game
+        writer = replay.ReplayWriter(damaged)
+        try:
+            writer.start_game(-1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("a negative seed was written")
+        finally:
+            writer.file.close()
+
+
+def test_deal_database_round_trip():
+    variant = rules.VARIANTS["vegas"]
+    rng = random.Random(0)
+    results = {}
+    for seed in rng.sample(range(10 ** 6), 500):
+        won = rng.choice([True, False, None])
+        results[seed] = won, rng.randrange(80, 200) if won else 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "deals.db")
+        dealdb.write_database(path, [(seed, won, length) for seed, (won, length) in results.items()], variant)
+        database = dealdb.DealDatabase(path)
+        try:
+            assert database.variant == variant and len(database) == len(results)
+            for seed, (won, length) in results.items():
+                expected = {True: length, False: dealdb.NOT_WINNABLE, None: dealdb.UNKNOWN}[won]
+                assert database.lookup(seed) == expected
+            assert database.lookup(10 ** 6) is None
+            for _ in range(20):
+                seed, length = database.random_winnable(rng)
+                assert results[seed] == (True, length)
+        finally:
+            database.close()
+
+
+def test_deal_database_rejects_negative_seeds():
+    # Refused by argparse, before any deal is solved
+    try:
+        dealdb.main(["--first-seed", "-5", "--count", "1", "--out", os.devnull])
+    except SystemExit as error:
+        assert error.code == 2
+    else:
+        raise AssertionError("a negative seed was accepted")
+
+
+if __name__ == "__main__":
+    for test in (test_batch_matches_rules, test_incremental_hashes, test_solver_lines_win,
+                 test_layout_hit_testing, test_replay_round_trip, test_replay_cut_off_or_corrupt,
+                 test_deal_database_round_trip,
+                 test_deal_database_rejects_negative_seeds):
+        test()
+        print(f"{test.__name__}: ok")